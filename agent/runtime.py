@@ -0,0 +1,237 @@
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from openai import OpenAI
+from agent.tool_registry import ToolRegistry
+
+# assistants: Assistants APIのポーリング（既定）、chat: Chat Completionsのストリーミング
+AGENT_RUNTIME = os.environ.get("AGENT_RUNTIME", "assistants").lower()
+
+
+class AssistantsRuntime:
+    """
+    Assistants APIでスレッドを作成し、Runの完了までポーリングする。
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        assistant_id: str,
+        tools: ToolRegistry,
+        response_format: dict,
+    ):
+        self.client = client
+        self.assistant_id = assistant_id
+        self.tools = tools
+        self.response_format = response_format
+
+    def run(self, prompt: str, context: Dict[str, Any] = None) -> str:
+        """
+        最終的なアシスタントのメッセージのテキストを返す。得られなければNoneを返す。
+        """
+        thread = self.client.beta.threads.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                },
+            ]
+        )
+        try:
+            run = self.client.beta.threads.runs.create_and_poll(
+                thread_id=thread.id,
+                assistant_id=self.assistant_id,
+                response_format=self.response_format,
+                tools=self.tools.schemas,
+            )
+
+            # ツール呼び出しが必要な場合、その処理を実施
+            while run.status == "requires_action":
+                tool_outputs = self.tools.dispatch(
+                    run.required_action.submit_tool_outputs.tool_calls, context
+                )
+                # ツールの出力を送信して再度ポーリング
+                run = self.client.beta.threads.runs.submit_tool_outputs_and_poll(
+                    thread_id=thread.id,
+                    run_id=run.id,
+                    tool_outputs=tool_outputs,
+                )
+
+            if run.status != "completed":
+                raise RuntimeError(f"Run finished with status '{run.status}'.")
+
+            messages = self.client.beta.threads.messages.list(thread_id=thread.id)
+            assistant_messages = [m for m in messages.data if m.role == "assistant"]
+            if not assistant_messages:
+                return None
+            final_msg = assistant_messages[-1]
+            return next(
+                (c.text.value for c in final_msg.content if c.type == "text"), None
+            )
+        finally:
+            # スレッドのリソースを削除
+            self.client.beta.threads.delete(thread.id)
+
+
+class ChatCompletionsRuntime:
+    """
+    Chat Completions APIのストリーミングでツール呼び出しを含む応答を生成する。
+    スレッドの作成や削除、Runのポーリングを行わないため、往復の回数と待ち時間が少ない。
+    """
+
+    MAX_ROUNDS = 8  # ツール呼び出しを含む往復の上限
+
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str,
+        instructions: str,
+        tools: ToolRegistry,
+        response_format: dict,
+    ):
+        self.client = client
+        self.model = model
+        self.instructions = instructions
+        self.tools = tools
+        self.response_format = response_format
+        self.last_timing: Dict[str, Any] = {}
+
+    def _stream(self, messages: List[dict], timing: dict):
+        """
+        1回分の応答をストリーミングで受け取り、(本文, ツール呼び出しのリスト, 終了理由) を返す。
+        """
+        started = time.monotonic()
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "response_format": self.response_format,
+            "stream": True,
+        }
+        # ツールを登録していない場合は、空のtoolsを送らない
+        if self.tools.schemas:
+            params["tools"] = self.tools.schemas
+        stream = self.client.chat.completions.create(**params)
+        content = []
+        tool_calls = {}
+        finish_reason = None
+        first_token = None
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            if first_token is None and (delta.content or delta.tool_calls):
+                first_token = time.monotonic() - started
+            if delta.content:
+                content.append(delta.content)
+            # ツール呼び出しの名前と引数は分割されて届くため、indexごとに連結する
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(
+                    call.index, {"id": None, "name": [], "arguments": []}
+                )
+                if call.id:
+                    entry["id"] = call.id
+                if call.function and call.function.name:
+                    entry["name"].append(call.function.name)
+                if call.function and call.function.arguments:
+                    entry["arguments"].append(call.function.arguments)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+
+        timing["first_token_seconds"].append(first_token)
+        timing["model_seconds"] += time.monotonic() - started
+        calls = [
+            SimpleNamespace(
+                id=entry["id"],
+                type="function",
+                function=SimpleNamespace(
+                    name="".join(entry["name"]),
+                    arguments="".join(entry["arguments"]),
+                ),
+            )
+            for _, entry in sorted(tool_calls.items())
+        ]
+        return "".join(content), calls, finish_reason
+
+    def run(self, prompt: str, context: Dict[str, Any] = None) -> str:
+        """
+        最終的な応答のテキストを返す。得られなければNoneを返す。
+        """
+        started = time.monotonic()
+        timing = {
+            "rounds": 0,
+            "first_token_seconds": [],
+            "model_seconds": 0.0,
+            "tool_seconds": 0.0,
+        }
+        messages = [
+            {"role": "system", "content": self.instructions},
+            {"role": "user", "content": prompt},
+        ]
+        try:
+            for _ in range(self.MAX_ROUNDS):
+                timing["rounds"] += 1
+                content, calls, finish_reason = self._stream(messages, timing)
+                if not calls:
+                    if finish_reason not in ("stop", None):
+                        raise RuntimeError(
+                            f"Completion finished with reason '{finish_reason}'."
+                        )
+                    return content or None
+
+                messages.append(
+                    {
+                        "role": "assistant",
+                        "content": content or None,
+                        "tool_calls": [
+                            {
+                                "id": call.id,
+                                "type": "function",
+                                "function": {
+                                    "name": call.function.name,
+                                    "arguments": call.function.arguments,
+                                },
+                            }
+                            for call in calls
+                        ],
+                    }
+                )
+                tool_started = time.monotonic()
+                tool_outputs = self.tools.dispatch(calls, context)
+                timing["tool_seconds"] += time.monotonic() - tool_started
+                for tool_output in tool_outputs:
+                    messages.append(
+                        {
+                            "role": "tool",
+                            "tool_call_id": tool_output["tool_call_id"],
+                            "content": tool_output["output"],
+                        }
+                    )
+            raise RuntimeError(
+                f"No final response after {self.MAX_ROUNDS} rounds of tool calls."
+            )
+        finally:
+            timing["total_seconds"] = time.monotonic() - started
+            self.last_timing = timing
+            print(f"[INFO] Chat completion timing: {timing}")
+
+
+def create_runtime(
+    runtime: str,
+    client: OpenAI,
+    model: str,
+    instructions: str,
+    assistant_id: str,
+    tools: ToolRegistry,
+    response_format: dict,
+):
+    """
+    runtimeに応じたランタイムを返す。指定がなければ環境変数AGENT_RUNTIMEに従う。
+    """
+    runtime = (runtime or AGENT_RUNTIME).lower()
+    if runtime == "assistants":
+        return AssistantsRuntime(client, assistant_id, tools, response_format)
+    if runtime == "chat":
+        return ChatCompletionsRuntime(client, model, instructions, tools, response_format)
+    raise ValueError(f"Unknown agent runtime: {runtime}")
@@ -0,0 +1,63 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, List
+
+
+class ToolDispatcher:
+    """
+    1回のrequires_actionで要求されたツール呼び出しを並列に実行し、
+    tool_callsと同じ順序でsubmit_tool_outputsに渡す出力を返す。
+    失敗やタイムアウトはエラーメッセージを出力として返し、Run全体は中断しない。
+    """
+
+    DEFAULT_TIMEOUT = 60  # 秒
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Any],
+        timeouts: Dict[str, float] = None,
+    ):
+        """
+        handlerはtool_callを受け取り、ツールの出力を返す関数。
+        timeoutsはツール名ごとの制限時間（秒）で、指定がなければDEFAULT_TIMEOUTを使う。
+        """
+        self.handler = handler
+        self.timeouts = dict(timeouts or {})
+
+    def run(self, tool_calls) -> List[Dict[str, str]]:
+        if not tool_calls:
+            return []
+        started = time.monotonic()
+        # 制限時間を一斉に開始した時点から数えるため、待ち行列に入るツールがないよう呼び出しごとにスレッドを用意する
+        executor = ThreadPoolExecutor(max_workers=len(tool_calls))
+        try:
+            futures = [executor.submit(self.handler, call) for call in tool_calls]
+            tool_outputs = []
+            for tool_call, future in zip(tool_calls, futures):
+                name = tool_call.function.name
+                timeout = self.timeouts.get(name, self.DEFAULT_TIMEOUT)
+                try:
+                    # 各ツールの制限時間は、一斉に開始した時点から数える
+                    output = future.result(
+                        timeout=max(started + timeout - time.monotonic(), 0)
+                    )
+                except TimeoutError:
+                    print(f"[ERROR] Tool '{name}' timed out after {timeout} seconds.")
+                    output = f"Tool '{name}' timed out after {timeout} seconds."
+                except Exception as e:
+                    print(f"[ERROR] Tool '{name}' failed: {e}")
+                    output = f"Tool '{name}' failed: {e}"
+                tool_outputs.append(
+                    {
+                        "tool_call_id": tool_call.id,
+                        "output": json.dumps(output, ensure_ascii=False),
+                    }
+                )
+            print(
+                f"[INFO] Ran {len(tool_calls)} tool calls in {time.monotonic() - started:.2f}s"
+            )
+            return tool_outputs
+        finally:
+            # タイムアウトしたツールの完了を待たずに結果を返す
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,209 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+from agent.tool_dispatcher import ToolDispatcher
+
+# JSON Schemaの型とPythonの型の対応（boolはintのサブクラスのため別に判定する）
+JSON_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "object": (dict,),
+    "array": (list,),
+}
+
+
+class Tool:
+    def __init__(
+        self,
+        schema: dict,
+        func: Callable[..., Any],
+        timeout: float = None,
+        cache_ttl: float = None,
+        context_args: Tuple[str, ...] = (),
+    ):
+        """
+        schemaはAssistants APIのtools形式の定義。context_argsに指定した引数は、
+        モデルの引数ではなくdispatch時のcontextから渡す。
+        """
+        self.schema = schema
+        self.name = schema["function"]["name"]
+        self.parameters = schema["function"].get("parameters", {})
+        self.func = func
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.context_args = tuple(context_args)
+
+
+class ToolRegistry:
+    """
+    ツールの定義と実装の対応を保持し、引数の検証、出力のキャッシュ、実行時間の計測を行う。
+    キャッシュと計測値はプロセス内で共有する。
+    """
+
+    CACHE_SIZE = 256
+
+    _cache = OrderedDict()
+    _metrics = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.tools: Dict[str, Tool] = {}
+
+    def register(
+        self,
+        schema: dict,
+        func: Callable[..., Any],
+        timeout: float = None,
+        cache_ttl: float = None,
+        context_args: Tuple[str, ...] = (),
+    ) -> Tool:
+        tool = Tool(schema, func, timeout, cache_ttl, context_args)
+        self.tools[tool.name] = tool
+        return tool
+
+    @property
+    def schemas(self) -> List[dict]:
+        return [tool.schema for tool in self.tools.values()]
+
+    @staticmethod
+    def validate(tool: Tool, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        スキーマに従って引数を検証し、定義されていない引数を除いて返す。
+        """
+        if not isinstance(arguments, dict):
+            raise ValueError(f"Arguments of '{tool.name}' must be an object.")
+        properties = tool.parameters.get("properties", {})
+        for name in tool.parameters.get("required", []):
+            if arguments.get(name) is None:
+                raise ValueError(f"Missing required argument '{name}' for '{tool.name}'.")
+
+        validated = {}
+        for name, value in arguments.items():
+            spec = properties.get(name)
+            if spec is None or value is None:
+                continue
+            expected = JSON_TYPES.get(spec.get("type"))
+            if expected and (
+                not isinstance(value, expected)
+                or (isinstance(value, bool) and spec.get("type") != "boolean")
+            ):
+                raise ValueError(
+                    f"Argument '{name}' of '{tool.name}' must be {spec['type']}."
+                )
+            if "enum" in spec and value not in spec["enum"]:
+                raise ValueError(
+                    f"Argument '{name}' of '{tool.name}' must be one of {spec['enum']}."
+                )
+            if "minimum" in spec and value < spec["minimum"]:
+                raise ValueError(
+                    f"Argument '{name}' of '{tool.name}' must be >= {spec['minimum']}."
+                )
+            if "maximum" in spec and value > spec["maximum"]:
+                raise ValueError(
+                    f"Argument '{name}' of '{tool.name}' must be <= {spec['maximum']}."
+                )
+            validated[name] = value
+        return validated
+
+    @staticmethod
+    def _cache_key(tool: Tool, arguments: Dict[str, Any]) -> str:
+        return f"{tool.name}\n{json.dumps(arguments, sort_keys=True, ensure_ascii=False)}"
+
+    def _get_cached(self, key: str):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            output, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def _set_cached(self, key: str, output: Any, ttl: float):
+        with self._lock:
+            self._cache[key] = (output, time.monotonic() + ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _record(self, name: str, elapsed: float, error: bool = False, cached: bool = False):
+        with self._lock:
+            metric = self._metrics.setdefault(
+                name, {"calls": 0, "errors": 0, "cache_hits": 0, "total_seconds": 0.0}
+            )
+            metric["calls"] += 1
+            metric["errors"] += int(error)
+            metric["cache_hits"] += int(cached)
+            metric["total_seconds"] += elapsed
+
+    def call(
+        self, name: str, arguments: Dict[str, Any], context: Dict[str, Any] = None
+    ) -> Any:
+        """
+        ツールを実行して出力を返す。未登録のツールや不正な引数はValueErrorを送出する。
+        """
+        tool = self.tools.get(name)
+        if tool is None:
+            raise ValueError(f"Unknown tool: {name}")
+        arguments = self.validate(tool, arguments)
+
+        started = time.monotonic()
+        key = self._cache_key(tool, arguments) if tool.cache_ttl else None
+        if key:
+            entry = self._get_cached(key)
+            if entry is not None:
+                self._record(name, time.monotonic() - started, cached=True)
+                return entry[0]
+
+        context = context or {}
+        kwargs = dict(arguments, **{arg: context.get(arg) for arg in tool.context_args})
+        try:
+            output = tool.func(**kwargs)
+        except Exception:
+            self._record(name, time.monotonic() - started, error=True)
+            raise
+        self._record(name, time.monotonic() - started)
+        if key:
+            self._set_cached(key, output, tool.cache_ttl)
+        return output
+
+    def execute(self, tool_call, context: Dict[str, Any] = None) -> Any:
+        """
+        Assistants APIのtool_callを実行する。引数はJSON文字列として受け取る。
+        """
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON arguments for '{tool_call.function.name}': {e}")
+        return self.call(tool_call.function.name, arguments, context)
+
+    def dispatch(self, tool_calls, context: Dict[str, Any] = None) -> List[Dict[str, str]]:
+        """
+        tool_callsを並列に実行し、submit_tool_outputsに渡す出力を順序通りに返す。
+        """
+        timeouts = {
+            name: tool.timeout for name, tool in self.tools.items() if tool.timeout
+        }
+        dispatcher = ToolDispatcher(
+            lambda tool_call: self.execute(tool_call, context), timeouts=timeouts
+        )
+        tool_outputs = dispatcher.run(tool_calls)
+        print(f"[INFO] Tool metrics: {self.metrics()}")
+        return tool_outputs
+
+    @staticmethod
+    def metrics() -> Dict[str, Dict[str, float]]:
+        with ToolRegistry._lock:
+            return {
+                name: dict(
+                    metric,
+                    average_seconds=metric["total_seconds"] / metric["calls"],
+                )
+                for name, metric in ToolRegistry._metrics.items()
+            }
@@ -1,5 +1,8 @@
+import os
 import json
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
 from google.cloud.firestore_v1.vector import Vector
 from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
 from google.cloud import firestore
@@ -10,135 +13,145 @@ from article_content_fetcher import ArticleContentFetcher
 from article_cleaner import ArticleCleaner
 from article_summary_generator import ArticleSummaryGenerator
 from web_searcher import WebSearcher
+from html_text_extractor import HtmlTextExtractor
+from query_embedding_cache import QueryEmbeddingCache
+from article_vector_index import ArticleVectorIndex
+from rss_feeds import RSS_FEEDS
+from context_packer import ContextPacker
+from agent.tool_registry import ToolRegistry
+from components import Components
 
+# falseの場合、メモリ上のインデックスを使わず常にFirestoreのベクトル検索を行う
+USE_LOCAL_VECTOR_INDEX = os.environ.get("LOCAL_VECTOR_INDEX", "true").lower() != "false"
 
-ANSWER_TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "vector_db_article_search",
-            "description": "ベクトルデータベースを用いてクエリに関連する記事を検索し、テキストとして返す",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "検索に用いるクエリ文字列",
-                    },
+# これより短い本文しか抽出できなかった場合はLLMによる整形の対象とする
+MIN_EXTRACTED_LENGTH = 200
+
+# 取得した記事の整形と要約を並列に行うスレッド数の上限
+SUMMARIZE_CONCURRENCY = 4
+
+# 保存済みの記事の要約を、取得し直さずに再利用する期間（要約を生成した日時から）
+ARTICLE_CACHE_TTL = timedelta(days=30)
+
+# vector_db_article_searchで返す記事数の既定値と上限
+DEFAULT_SEARCH_RESULTS = 3
+MAX_SEARCH_RESULTS = 10
+DEFAULT_DISTANCE_MEASURE = "EUCLIDEAN"
+# Firestoreのベクトル検索で絞り込みを行う場合に、件数の何倍を取得してから絞り込むか
+REMOTE_FILTER_OVERFETCH = 5
+VECTOR_DB_ARTICLE_SEARCH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "vector_db_article_search",
+        "description": "ベクトルデータベースを用いてクエリに関連する記事を検索し、テキストとして返す",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "検索に用いるクエリ文字列",
+                },
+                "k": {
+                    "type": "integer",
+                    "description": "取得する記事の件数（既定値は3）",
+                    "minimum": 1,
+                    "maximum": MAX_SEARCH_RESULTS,
+                },
+                "distance_measure": {
+                    "type": "string",
+                    "enum": list(ArticleVectorIndex.DISTANCE_MEASURES),
+                    "description": "ベクトルの距離の種類（既定値はEUCLIDEAN）",
+                },
+                "distance_threshold": {
+                    "type": "number",
+                    "description": "この距離より遠い記事を除外する。DOT_PRODUCTの場合はこの値未満の記事を除外する",
+                },
+                "published_within_days": {
+                    "type": "integer",
+                    "description": "指定した日数以内に公開された記事に絞り込む",
+                    "minimum": 1,
+                },
+                "source": {
+                    "type": "string",
+                    "enum": list(RSS_FEEDS),
+                    "description": "記事の配信元のRSSフィードで絞り込む",
+                },
+                "language": {
+                    "type": "string",
+                    "enum": ["ja", "en"],
+                    "description": "記事の言語で絞り込む",
                 },
-                "required": ["query"],
             },
+            "required": ["query"],
         },
     },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_recent_conversation_history",
-            "description": "ユーザーとの直近の会話履歴を取得し、テキストとして返します。",
-            "parameters": {
-                "type": "object",
-                "properties": {},
-                "required": [],
-            },
+}
+
+CONVERSATION_HISTORY_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_recent_conversation_history",
+        "description": "ユーザーとの直近の会話履歴を取得し、テキストとして返します。",
+        "parameters": {
+            "type": "object",
+            "properties": {},
+            "required": [],
         },
     },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_article_title_url_list",
-            "description": "指定したクエリでウェブ検索を行い、検索結果のタイトルとURLのリストを返す",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "ウェブ検索に用いるクエリ文字列",
-                    },
+}
+
+ARTICLE_TITLE_URL_LIST_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_article_title_url_list",
+        "description": "指定したクエリでウェブ検索を行い、検索結果のタイトルとURLのリストを返す",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "ウェブ検索に用いるクエリ文字列",
                 },
-                "required": ["query"],
             },
+            "required": ["query"],
         },
     },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_article_from_title_url",
-            "description": "タイトルとURLを渡すと、ページ内容を要約したテキストを返す",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "title": {
-                        "type": "string",
-                        "description": "記事のタイトル"
-                    },
-                    "url": {
-                        "type": "string",
-                        "description": "記事のURL"
-                    },
+}
+
+ARTICLE_FROM_TITLE_URL_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_article_from_title_url",
+        "description": "タイトルとURLを渡すと、ページ内容を要約したテキストを返す",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "title": {
+                    "type": "string",
+                    "description": "記事のタイトル"
+                },
+                "url": {
+                    "type": "string",
+                    "description": "記事のURL"
                 },
-                "required": ["title", "url"],
             },
+            "required": ["title", "url"],
         },
     },
+}
+
+ANSWER_TOOLS = [
+    VECTOR_DB_ARTICLE_SEARCH_TOOL,
+    CONVERSATION_HISTORY_TOOL,
+    ARTICLE_TITLE_URL_LIST_TOOL,
+    ARTICLE_FROM_TITLE_URL_TOOL,
 ]
 
 
 NEWS_GENERATION_TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "vector_db_article_search",
-            "description": "ベクトルデータベースを用いてクエリに関連する記事を検索し、テキストとして返す",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "検索に用いるクエリ文字列",
-                    },
-                },
-                "required": ["query"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_article_title_url_list",
-            "description": "指定したクエリでウェブ検索を行い、検索結果のタイトルとURLのリストを返す",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "ウェブ検索に用いるクエリ文字列",
-                    },
-                },
-                "required": ["query"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_article_from_title_url",
-            "description": "タイトルとURLを渡すと、ページ内容を要約したテキストを返す",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "title": {
-                        "type": "string",
-                        "description": "記事のタイトル"
-                    },
-                    "url": {
-                        "type": "string",
-                        "description": "記事のURL"
-                    },
-                },
-                "required": ["title", "url"],
-            },
-        },
-    },
+    VECTOR_DB_ARTICLE_SEARCH_TOOL,
+    ARTICLE_TITLE_URL_LIST_TOOL,
+    ARTICLE_FROM_TITLE_URL_TOOL,
 ]
 
 
@@ -146,51 +159,119 @@ def clean_url(url: str) -> str:
     return url.split("?")[0]
 
 
-def format_articles(articles: list) -> str:
+def format_articles(
+    articles: list, token_budget: int = ContextPacker.TOKEN_BUDGET
+) -> str:
     """
-    検索結果のリストをフォーマットして文字列にまとめる。
+    検索結果のリストを、関連度に応じてトークン数の上限内に収まるようまとめる。
     """
-    
-    articles_section = ""
-    for index, article in enumerate(articles):
-        title = article.get("title", "")
-        url = clean_url(article.get("url", ""))
-        summary = article.get("summary", "")
-        body = article.get("body", "")
-
-        if index == 0:
-            articles_section += (
-                f"title: {title}\n"
-                f"url: {url}\n"
-                f"summary: {summary}\n"
-                f"body: {body[:3000]}\n\n"
-            )
-        else:
-            articles_section += (
-                f"title: {title}\n" f"url: {url}\n" f"summary: {summary[:500]}\n\n"
-            )
-    return articles_section
-
+    return ContextPacker.pack(
+        [{**article, "url": clean_url(article.get("url", ""))} for article in articles],
+        token_budget,
+    )
 
-def vector_db_article_search(article_collection, query: str) -> str:
-    print(f"Calling vector_db_article_search with query: {query}")
-    
-    query_vector = genai.embed_content(model=Article.EMBEDDING_MODEL, content=query)["embedding"]
 
-    vector_query = article_collection.select(
-        ["id", "title", "summary", "body", "url", "published"]
-    ).find_nearest(
+def _firestore_nearest_articles(
+    article_collection,
+    query_vector,
+    limit: int,
+    distance_measure: str = DEFAULT_DISTANCE_MEASURE,
+    distance_threshold: float = None,
+    published_after: datetime = None,
+    source: str = None,
+    language: str = None,
+) -> list:
+    """
+    Firestoreのベクトル検索で記事を取得する。
+    where()を組み合わせると複合ベクトルインデックスが必要になるため、絞り込みがある場合は
+    REMOTE_FILTER_OVERFETCH倍の件数を取得してから絞り込む。
+    """
+    filtered = published_after is not None or source or language
+    query = article_collection.select(
+        ["id", "title", "summary", "body", "url", "published", "source", "language"]
+    )
+    vector_query = query.find_nearest(
         vector_field="embedding",
         query_vector=Vector(query_vector),
-        distance_measure=DistanceMeasure.EUCLIDEAN,
-        limit=3,
+        distance_measure=DistanceMeasure[distance_measure],
+        limit=limit * REMOTE_FILTER_OVERFETCH if filtered else limit,
+        distance_threshold=distance_threshold,
     )
 
     articles = []
     for doc in vector_query.stream():
         article_data = doc.to_dict()
-        if article_data and "id" in article_data:
-            articles.append(article_data)
+        if not article_data or "id" not in article_data:
+            continue
+        if source and article_data.get("source") != source:
+            continue
+        if language and article_data.get("language") != language:
+            continue
+        if published_after is not None:
+            published = Article.published_datetime(article_data.get("published"))
+            if published is None or published < published_after:
+                continue
+        articles.append(article_data)
+    return articles[:limit]
+
+
+def vector_db_article_search(
+    article_collection,
+    query: str,
+    k: int = DEFAULT_SEARCH_RESULTS,
+    distance_measure: str = DEFAULT_DISTANCE_MEASURE,
+    distance_threshold: float = None,
+    published_within_days: int = None,
+    source: str = None,
+    language: str = None,
+    embedding_cache: QueryEmbeddingCache = None,
+) -> str:
+    """
+    距離の種類、件数、距離の閾値と、公開日・配信元・言語による絞り込みを指定して記事を検索する。
+    embedding_cacheを指定しなければ、ウォームインスタンス内で共有するComponentsのものを使う。
+    """
+    print(f"Calling vector_db_article_search with query: {query}")
+
+    distance_measure = distance_measure.upper()
+    if distance_measure not in ArticleVectorIndex.DISTANCE_MEASURES:
+        raise ValueError(f"Unsupported distance measure: {distance_measure}")
+    k = max(1, min(int(k), MAX_SEARCH_RESULTS))
+    published_after = None
+    if published_within_days:
+        published_after = datetime.now(timezone.utc) - timedelta(
+            days=published_within_days
+        )
+    options = {
+        "distance_measure": distance_measure,
+        "distance_threshold": distance_threshold,
+        "published_after": published_after,
+        "source": source,
+        "language": language,
+    }
+
+    embedding_cache = embedding_cache or Components.query_embedding_cache()
+    query_vector = embedding_cache.embed(query, model=Article.EMBEDDING_MODEL)
+    print(f"[INFO] Query embedding cache: {embedding_cache.metrics()}")
+
+    # ウォームインスタンスではメモリ上のインデックスでベクトル検索と全文検索を組み合わせ、
+    # 無効な場合や失敗した場合はFirestoreでベクトル検索のみを行う
+    # （絞り込みの結果が0件の場合はそのまま返す）
+    articles = []
+    searched = False
+    if USE_LOCAL_VECTOR_INDEX:
+        try:
+            index = ArticleVectorIndex.for_collection(article_collection)
+            articles = index.hybrid_search(query_vector, query, k=k, **options)
+            searched = True
+        except Exception as e:
+            print(f"[ERROR] Local vector index search failed: {e}")
+    if not searched:
+        try:
+            articles = _firestore_nearest_articles(
+                article_collection, query_vector, limit=k, **options
+            )
+        except Exception as e:
+            print(f"[ERROR] Firestore vector search failed: {e}")
 
     return format_articles(articles)
 
@@ -215,23 +296,76 @@ def get_article_title_url_list(
     return json.dumps(results_list, ensure_ascii=False)
 
 
-def get_article_from_title_url(
-    content_fetcher: ArticleContentFetcher,
+def _format_article_summary(title: str, url: str, summary: str) -> str:
+    return (
+        f"title: {title}\n"
+        f"url: {url}\n"
+        f"summary: {summary}\n"
+    )
+
+
+def _cached_article_summaries(
+    db: firestore.Client, article_collection, items: List[Dict[str, str]]
+) -> Dict[str, str]:
+    """
+    保存済みで本文があり、ARTICLE_CACHE_TTL以内に要約を生成した記事の要約テキストをURLごとに返す。
+    RSSのフィードの要約をそのまま保存した記事（summarized_atがない記事）は使わない。
+    """
+    urls_by_id = {Article.create_id(item["url"]): item["url"] for item in items}
+    try:
+        articles = Article.get_many(
+            db,
+            article_collection,
+            list(urls_by_id),
+            field_paths=["id", "title", "url", "summary", "body", "summarized_at"],
+        )
+    except Exception as e:
+        print(f"[ERROR] Failed to look up stored articles: {e}")
+        return {}
+
+    cutoff = datetime.now(timezone.utc) - ARTICLE_CACHE_TTL
+    summaries = {}
+    for id, article in articles.items():
+        summarized_at = Article.published_datetime(article.summarized_at)
+        if (
+            not (article.summary and article.body)
+            or summarized_at is None
+            or summarized_at < cutoff
+        ):
+            continue
+        url = urls_by_id[id]
+        summaries[url] = _format_article_summary(article.title, url, article.summary)
+    return summaries
+
+
+def _summarize_fetched_article(
     article_cleaner: ArticleCleaner,
     summary_generator: ArticleSummaryGenerator,
     article_collection,
     title: str,
     url: str,
+    html: str,
+    llm_fallback: bool = False,
 ) -> str:
-    print(f"Calling create_article_from_title_url with query: {title}")
+    """
+    取得したページを整形・要約して保存し、要約テキストを返す。失敗した場合はNoneを返す。
+    """
     try:
-        raw_content = content_fetcher.fetch(url)
-        if not raw_content:
-            return f"No content fetched from {url}."
+        if not html:
+            print(f"[ERROR] No content fetched from {url}")
+            return None
 
-        clean_result = article_cleaner.llm_clean_text(raw_content, title)
+        clean_result = article_cleaner.extract_main_content(html, title)
+        # 本文を抽出できなかった場合のみ、指定があればLLMで整形する
+        if len(clean_result["clean_text"]) < MIN_EXTRACTED_LENGTH and llm_fallback:
+            raw_content = HtmlTextExtractor.paragraphs(html)
+            if raw_content:
+                clean_result = article_cleaner.llm_clean_text(raw_content, title)
         clean_text = clean_result.get("clean_text", "")
         keyword = clean_result.get("keyword", "")
+        if not clean_text:
+            print(f"[ERROR] No content extracted from {url}")
+            return None
 
         summary = summary_generator.generate_summary(title, clean_text)
 
@@ -241,16 +375,144 @@ def get_article_from_title_url(
             url=url,
             body=clean_text,
             keyword=keyword,
+            summarized_at=datetime.now(timezone.utc),
         )
         article.save(article_collection)
 
-        formatted_article = (
-            f"title: {title}\n"
-            f"url: {url}\n"
-            f"summary: {summary}\n"
-        )
-        return formatted_article
+        return _format_article_summary(title, url, summary)
 
     except Exception as e:
-        print(f"Failed to process article at {url}: {e}")
-        return f"Failed to process article at {url}: {str(e)}"
+        print(f"[ERROR] Failed to process article at {url}: {e}")
+        return None
+
+
+def get_articles_from_title_urls(
+    content_fetcher: ArticleContentFetcher,
+    article_cleaner: ArticleCleaner,
+    summary_generator: ArticleSummaryGenerator,
+    article_collection,
+    items: List[Dict[str, str]],
+    llm_fallback: bool = False,
+    db: firestore.Client = None,
+) -> List[str]:
+    """
+    タイトルとURLの組をまとめて受け取り、本文を並列に取得してそれぞれの要約テキストを返す。
+    llm_fallbackを指定すると、本文を抽出できなかったページのみLLMで整形する。
+    dbを渡すと保存済みの記事を先に確認し、新しいものは取得・要約せずに保存済みの要約を返す。
+    取得・要約できなかった記事は結果に含めない。
+    """
+    if not items:
+        return []
+    cached = _cached_article_summaries(db, article_collection, items) if db else {}
+    pending = [item for item in items if item["url"] not in cached]
+    if cached:
+        print(f"[INFO] Reused {len(items) - len(pending)} stored article summaries")
+    if not pending:
+        return [cached[item["url"]] for item in items]
+
+    html_by_url = content_fetcher.fetch_html_many([item["url"] for item in pending])
+    content_fetcher.log_connection_stats()
+    max_workers = min(SUMMARIZE_CONCURRENCY, len(pending))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            item["url"]: executor.submit(
+                _summarize_fetched_article,
+                article_cleaner,
+                summary_generator,
+                article_collection,
+                item["title"],
+                item["url"],
+                html_by_url.get(item["url"], ""),
+                llm_fallback,
+            )
+            for item in pending
+        }
+        summaries = [
+            cached[item["url"]] if item["url"] in cached else futures[item["url"]].result()
+            for item in items
+        ]
+    return [summary for summary in summaries if summary]
+
+
+def get_article_from_title_url(
+    content_fetcher: ArticleContentFetcher,
+    article_cleaner: ArticleCleaner,
+    summary_generator: ArticleSummaryGenerator,
+    article_collection,
+    title: str,
+    url: str,
+    llm_fallback: bool = False,
+    db: firestore.Client = None,
+) -> str:
+    """
+    失敗した場合はRuntimeErrorを送出する。ToolRegistryは例外をキャッシュしないため、
+    一時的な取得の失敗が次の呼び出しまで残らない。
+    """
+    print(f"Calling create_article_from_title_url with query: {title}")
+    summaries = get_articles_from_title_urls(
+        content_fetcher=content_fetcher,
+        article_cleaner=article_cleaner,
+        summary_generator=summary_generator,
+        article_collection=article_collection,
+        items=[{"title": title, "url": url}],
+        llm_fallback=llm_fallback,
+        db=db,
+    )
+    if not summaries:
+        raise RuntimeError(f"Failed to fetch or summarize the article at {url}")
+    return summaries[0]
+
+
+def create_tool_registry(
+    tools: List[dict],
+    db: firestore.Client,
+    article_collection,
+    web_searcher: WebSearcher,
+    content_fetcher: ArticleContentFetcher,
+    article_cleaner: ArticleCleaner,
+    summary_generator: ArticleSummaryGenerator,
+    embedding_cache: QueryEmbeddingCache,
+    llm_fallback: bool = False,
+) -> ToolRegistry:
+    """
+    toolsに含まれるツールの実装を登録したToolRegistryを返す。
+    get_recent_conversation_historyはdispatch時のcontextのuserを使う。
+    """
+    implementations = {
+        VECTOR_DB_ARTICLE_SEARCH_TOOL["function"]["name"]: dict(
+            func=lambda **arguments: vector_db_article_search(
+                article_collection, embedding_cache=embedding_cache, **arguments
+            ),
+            timeout=20,
+            cache_ttl=ArticleVectorIndex.REFRESH_INTERVAL,
+        ),
+        CONVERSATION_HISTORY_TOOL["function"]["name"]: dict(
+            func=lambda user: user.format_conversations(db),
+            timeout=10,
+            context_args=("user",),
+        ),
+        ARTICLE_TITLE_URL_LIST_TOOL["function"]["name"]: dict(
+            func=lambda query: get_article_title_url_list(web_searcher, query),
+            timeout=20,
+            cache_ttl=60 * 60,
+        ),
+        ARTICLE_FROM_TITLE_URL_TOOL["function"]["name"]: dict(
+            func=lambda title, url: get_article_from_title_url(
+                content_fetcher=content_fetcher,
+                article_cleaner=article_cleaner,
+                summary_generator=summary_generator,
+                article_collection=article_collection,
+                title=title,
+                url=url,
+                llm_fallback=llm_fallback,
+                db=db,
+            ),
+            timeout=90,
+            cache_ttl=60 * 60,
+        ),
+    }
+
+    registry = ToolRegistry()
+    for schema in tools:
+        registry.register(schema, **implementations[schema["function"]["name"]])
+    return registry
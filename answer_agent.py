@@ -10,11 +10,12 @@ from article_cleaner import ArticleCleaner
 from article_summary_generator import ArticleSummaryGenerator
 from web_searcher import WebSearcher
 from article import Article
+from query_embedding_cache import QueryEmbeddingCache
+from components import Components
+from agent.runtime import create_runtime
 from agent.tools import (
     ANSWER_TOOLS,
-    vector_db_article_search,
-    get_article_title_url_list,
-    get_article_from_title_url,
+    create_tool_registry,
 )
 
 GEMINI_MODEL = "gemini-1.5-flash"
@@ -61,15 +62,53 @@ class AnswerAgent:
         db: firestore.Client,
         web_searcher: WebSearcher,
         model: str = OPENAI_MODEL,
+        llm_cleaning_fallback: bool = False,
+        runtime: str = None,
+        client: OpenAI = None,
+        content_fetcher: ArticleContentFetcher = None,
+        article_cleaner: ArticleCleaner = None,
+        summary_generator: ArticleSummaryGenerator = None,
+        embedding_cache: QueryEmbeddingCache = None,
     ):
-        self.client = OpenAI()
+        """
+        指定しなかったクライアントは、ウォームインスタンス内で共有するComponentsのものを使う。
+        """
+        self.client = client or Components.openai()
         self.db = db
         self.model = model
         self.web_searcher = web_searcher
-        self.content_fetcher = ArticleContentFetcher()
-        self.article_cleaner = ArticleCleaner(GEMINI_MODEL)
-        self.summary_generator = ArticleSummaryGenerator(GEMINI_MODEL)
+        self.content_fetcher = content_fetcher or Components.content_fetcher()
+        self.article_cleaner = article_cleaner or Components.article_cleaner(GEMINI_MODEL)
+        self.summary_generator = summary_generator or Components.summary_generator(
+            GEMINI_MODEL
+        )
         self.article_collection = Article.collection(self.db)
+        self.embedding_cache = embedding_cache or Components.query_embedding_cache(
+            self.db
+        )
+        # 本文を抽出できなかったページのみLLMで整形する（既定では無効）
+        self.llm_cleaning_fallback = llm_cleaning_fallback
+        self.tools = create_tool_registry(
+            ANSWER_TOOLS,
+            db=self.db,
+            article_collection=self.article_collection,
+            web_searcher=self.web_searcher,
+            content_fetcher=self.content_fetcher,
+            article_cleaner=self.article_cleaner,
+            summary_generator=self.summary_generator,
+            embedding_cache=self.embedding_cache,
+            llm_fallback=self.llm_cleaning_fallback,
+        )
+        # 既定ではAssistants APIを使い、"chat"でChat Completionsのストリーミングを使う
+        self.runtime = create_runtime(
+            runtime,
+            client=self.client,
+            model=self.model,
+            instructions=INSTRUCTIONS,
+            assistant_id=OPENAI_ASSISTANTS_ID,
+            tools=self.tools,
+            response_format=RESPONSE_FORMAT,
+        )
 
     @staticmethod
     def create_assistant(client: OpenAI, model: str):
@@ -112,86 +151,12 @@ class AnswerAgent:
         user = User.get(user_ref, user_id)
 
         prompt = self.prompt(question=question, language_code=user.language_code)
-        thread = self.client.beta.threads.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ]
-        )
-
-        run = self.client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=OPENAI_ASSISTANTS_ID,
-            response_format=RESPONSE_FORMAT,
-            tools=ANSWER_TOOLS,
-        )
-
-        while run.status == "requires_action":
-            tool_outputs = []
-            for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                function_name = tool_call.function.name
-                arguments = json.loads(tool_call.function.arguments)
-
-                if function_name == "vector_db_article_search":
-                    output = vector_db_article_search(
-                        article_collection=self.article_collection,
-                        query=arguments["query"],
-                    )
-                elif function_name == "get_recent_conversation_history":
-                    conversation_text = user.format_conversations(self.db)
-                    output = conversation_text
-                elif function_name == "get_article_title_url_list":
-                    output = get_article_title_url_list(
-                        web_searcher=self.web_searcher,
-                        query=arguments["query"],
-                    )
-                elif function_name == "get_article_from_title_url":
-                    output = get_article_from_title_url(
-                        content_fetcher=self.content_fetcher,
-                        article_cleaner=self.article_cleaner,
-                        summary_generator=self.summary_generator,
-                        article_collection=self.article_collection,
-                        title=arguments["title"],
-                        url=arguments["url"],
-                    )
-                else:
-                    raise ValueError("Response does not contain valid JSON text.")
-
-                tool_outputs.append(
-                    {
-                        "tool_call_id": tool_call.id,
-                        "output": json.dumps(output, ensure_ascii=False),
-                    }
-                )
-
-            run = self.client.beta.threads.runs.submit_tool_outputs_and_poll(
-                thread_id=thread.id,
-                run_id=run.id,
-                tool_outputs=tool_outputs,
-            )
-
-        if run.status == "completed":
-            messages = self.client.beta.threads.messages.list(thread_id=thread.id)
-            assistant_messages = [m for m in messages.data if m.role == "assistant"]
-            if assistant_messages:
-                final_msg = assistant_messages[-1]
-                # JSON Schema に従って "answer" フィールドを取り出す
-                json_text = next(
-                    (c.text.value for c in final_msg.content if c.type == "text"), None
-                )
-                if json_text:
-                    parsed_result = json.loads(json_text)
-                    agent_answer = parsed_result["answer"]
-                else:
-                    raise RuntimeError("適切な回答を生成できませんでした。")
-            else:
-                raise RuntimeError("回答が得られませんでした。")
-        else:
-            raise RuntimeError("回答を生成できませんでした。別の質問をお試しください。")
+        json_text = self.runtime.run(prompt, context={"user": user})
+        if not json_text:
+            raise RuntimeError("適切な回答を生成できませんでした。")
 
-        # スレッドのリソースを削除
-        self.client.beta.threads.delete(thread.id)
+        # JSON Schema に従って "answer" フィールドを取り出す
+        parsed_result = json.loads(json_text)
+        agent_answer = parsed_result["answer"]
 
         return agent_answer
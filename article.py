@@ -1,23 +1,28 @@
-import os
 import re
 import json
-from datetime import datetime
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from typing import List
-from firebase_admin import firestore
 import google.generativeai as genai
+from google.cloud.firestore_v1 import ArrayUnion
 from google.cloud.firestore_v1.vector import Vector
-from datetime import datetime
+from google.cloud.firestore_v1.base_query import FieldFilter
 from article_content_fetcher import ArticleContentFetcher
 from article_cleaner import ArticleCleaner
-from article_summary_generator import ArticleSummaryGenerator
-from web_searcher import WebSearcher
 
 
 class Article:
     COLLECTION = "articles"
     MAX_LENGTH = 2000
+    # 本文の抽出に使うHTMLは、<p>のテキストがこの文字数に達した時点でダウンロードを打ち切る
+    # （本文はMAX_LENGTHで切り詰めるため、本文のブロックを判定できる余裕を持たせる）
+    FETCH_PARAGRAPH_CHARS = MAX_LENGTH * 4
     EMBEDDING_MODEL = "models/text-embedding-004"
     BYTE_LIMIT = 3000  # embed_contentのペイロードサイズ上限が10,000バイト
+    WRITE_BATCH_LIMIT = 500  # Firestoreの1バッチあたりの書き込み上限
+    EMBED_BATCH_SIZE = 100  # batchEmbedContentsの1リクエストあたりの上限
+    # かな・漢字がこの割合以上含まれる記事を日本語とみなす
+    JA_CHARACTER_RATIO = 0.2
 
     def __init__(
         self,
@@ -30,6 +35,9 @@ class Article:
         published: datetime = None,
         embedding: Vector = None,
         id: str = None,
+        language: str = None,
+        duplicate_urls: List[str] = None,
+        summarized_at: datetime = None,
     ):
         self.id = id if id else self.create_id(url)
         self.source = source
@@ -40,6 +48,36 @@ class Article:
         self.keyword = keyword
         self.published = published if published else datetime.now()
         self.embedding = embedding
+        self.language = (
+            language if language else self.detect_language(f"{title} {summary}")
+        )
+        # 別のURLで配信された同じ記事のURL
+        self.duplicate_urls = duplicate_urls if duplicate_urls else []
+        # 要約を生成した日時。RSSの要約をそのまま保存した記事はNone
+        self.summarized_at = summarized_at
+
+    @staticmethod
+    def _json_escaped_bytes(text: str) -> bytes:
+        # json.dumps(ensure_ascii=False)で文字列値として出力される部分のUTF-8バイト列
+        return json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+
+    @staticmethod
+    def _truncate_to_json_bytes(text: str, budget: int) -> str:
+        """
+        JSONエスケープ後のUTF-8バイト数がbudget以下になるよう、textの先頭部分を返す。
+        マルチバイト文字やエスケープシーケンスの途中では切らない。
+        """
+        if budget <= 0:
+            return ""
+        escaped = Article._json_escaped_bytes(text)
+        if len(escaped) <= budget:
+            return text
+        prefix = escaped[:budget].decode("utf-8", errors="ignore")
+        # 途中で切れたエスケープシーケンス（末尾の奇数個の\や不完全な\uXXXX）を除く
+        match = re.search(r"(\\+)(u[0-9a-fA-F]{0,3})?$", prefix)
+        if match and len(match.group(1)) % 2 == 1:
+            prefix = prefix[: match.start(1) + len(match.group(1)) - 1]
+        return json.loads(f'"{prefix}"')
 
     def to_json_for_embedding(self):
         data = {
@@ -48,24 +86,55 @@ class Article:
             "body": self.body if self.body else "",
         }
 
-        while True:
-            json_data = json.dumps(data, ensure_ascii=False)
-            byte_size = len(json_data.encode("utf-8"))
-
-            if byte_size <= self.BYTE_LIMIT:
-                break
+        json_data = json.dumps(data, ensure_ascii=False)
+        overflow = len(json_data.encode("utf-8")) - self.BYTE_LIMIT
+        if overflow <= 0:
+            return json_data
 
-            if data["body"]:
-                data["body"] = data["body"][: len(data["body"]) - 100]
-            elif data["summary"]:
-                data["summary"] = data["summary"][: len(data["summary"]) - 100]
-            elif data["title"]:
-                data["title"] = data["title"][: len(data["title"]) - 100]
-            else:
+        # 各フィールドのバイト数を一度だけ計算し、本文、要約、タイトルの順に超過分を削る
+        for field in ("body", "summary", "title"):
+            if not data[field]:
+                continue
+            cost = len(self._json_escaped_bytes(data[field]))
+            if cost >= overflow:
+                data[field] = self._truncate_to_json_bytes(data[field], cost - overflow)
                 break
+            data[field] = ""
+            overflow -= cost
 
         return json.dumps(data, ensure_ascii=False)
 
+    @staticmethod
+    def published_datetime(value) -> datetime:
+        """
+        publishedをタイムゾーン付きのdatetimeに変換する。
+        以前のRSS由来の記事は 'Mon, 06 Jan 2025 10:00:00 +0000' などの文字列で保存されている。
+        """
+        if isinstance(value, str):
+            try:
+                value = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                try:
+                    value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                except ValueError:
+                    return None
+        if not isinstance(value, datetime):
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+    @staticmethod
+    def detect_language(text: str) -> str:
+        """
+        かな・漢字の割合から記事の言語コード（'ja' または 'en'）を判定する。
+        """
+        letters = re.findall(r"[A-Za-z\u3040-\u30ff\u3400-\u9fff]", text or "")
+        if not letters:
+            return "en"
+        japanese = sum(1 for c in letters if c >= "\u3040")
+        return "ja" if japanese / len(letters) >= Article.JA_CHARACTER_RATIO else "en"
+
     @staticmethod
     def create_id(url):
         return re.sub(
@@ -78,23 +147,87 @@ class Article:
         content = self.to_json_for_embedding()
         response = genai.embed_content(model=self.EMBEDDING_MODEL, content=content)
         embedding = response["embedding"]
-        self.update(ref, {"embedding": Vector(embedding)})
+        self.update(
+            ref,
+            {"embedding": Vector(embedding), "embedded_at": datetime.now(timezone.utc)},
+        )
+
+    @staticmethod
+    def vectorize_many(db, ref, articles: List["Article"], force: bool = False) -> int:
+        """
+        複数の記事をまとめてベクトル化し、1回のバッチ書き込みで保存する。保存した件数を返す。
+        forceを指定すると、既にベクトルがある記事も再計算する。
+        """
+        targets = [a for a in articles if force or not a.embedding]
+        saved = 0
+        for start in range(0, len(targets), Article.WRITE_BATCH_LIMIT):
+            chunk = targets[start : start + Article.WRITE_BATCH_LIMIT]
+            batch = db.batch()
+            for offset in range(0, len(chunk), Article.EMBED_BATCH_SIZE):
+                group = chunk[offset : offset + Article.EMBED_BATCH_SIZE]
+                response = genai.embed_content(
+                    model=Article.EMBEDDING_MODEL,
+                    content=[a.to_json_for_embedding() for a in group],
+                )
+                for article, embedding in zip(group, response["embedding"]):
+                    article.embedding = Vector(embedding)
+                    batch.update(
+                        ref.document(article.id),
+                        {
+                            "embedding": article.embedding,
+                            "embedded_at": datetime.now(timezone.utc),
+                        },
+                    )
+            batch.commit()
+            saved += len(chunk)
+        return saved
+
+    @staticmethod
+    def get_pending_embeddings(ref, limit: int = 500) -> List["Article"]:
+        """
+        ベクトル未生成の記事を取得する。保存時と本文の取得時にembeddingはNoneで書き込まれる。
+        """
+        query = ref.where(filter=FieldFilter("embedding", "==", None)).limit(limit)
+        return [Article.from_dict(doc.to_dict()) for doc in query.stream()]
 
     def import_body(self, ref, cleaner: ArticleCleaner):
-        body = self.body
-        keyword = self.keyword
-        if body and keyword:
+        Article.import_bodies(ref, [self], cleaner)
+
+    @staticmethod
+    def import_bodies(ref, articles: List["Article"], cleaner: ArticleCleaner):
+        """
+        本文が未取得の記事をまとめて並列にスクレイピングし、整形した本文で更新する。
+        """
+        targets = [a for a in articles if not (a.body and a.keyword)]
+        if not targets:
             return
-        try:
-            body = ArticleContentFetcher.fetch(self.url)
-            body = cleaner.clean_text(body)[: self.MAX_LENGTH]
-            # TODO: llmを使わずスクレイピングの精度を改善、articleのkeyword使ってないなら削除
-            # clean_result = cleaner.llm_clean_text(body, self.title)
-            # body = clean_result.get("clean_text", "")
-            # keyword = clean_result.get("keyword", "")
-        except Exception as e:
-            print(f"[ERROR] Failed to fetch or clean body for URL '{self.url}': {e}")
-        self.update(ref, {"body": body, "keyword": ""})
+        html_by_url = ArticleContentFetcher.fetch_html_many(
+            [a.url for a in targets], max_chars=Article.FETCH_PARAGRAPH_CHARS
+        )
+        ArticleContentFetcher.log_connection_stats()
+        for article in targets:
+            body = article.body
+            keyword = article.keyword
+            try:
+                clean_result = cleaner.extract_main_content(
+                    html_by_url.get(article.url, ""), article.title
+                )
+                body = cleaner.clean_text(clean_result["clean_text"])[
+                    : Article.MAX_LENGTH
+                ]
+                keyword = clean_result["keyword"]
+            except Exception as e:
+                print(
+                    f"[ERROR] Failed to fetch or clean body for URL '{article.url}': {e}"
+                )
+            updates = {"body": body, "keyword": keyword}
+            # 本文の取得より先にタイトルと要約だけでベクトル化された場合も、本文を含めて再計算されるようにする
+            if body and body != article.body:
+                updates["embedding"] = None
+                article.embedding = None
+            article.body = body
+            article.keyword = keyword
+            article.update(ref, updates)
 
     @staticmethod
     def from_dict(source):
@@ -108,6 +241,9 @@ class Article:
             embedding=source.get("embedding"),
             published=source.get("published", datetime.now()),
             source=source.get("source"),
+            language=source.get("language"),
+            duplicate_urls=source.get("duplicate_urls", []),
+            summarized_at=source.get("summarized_at"),
         )
 
     def to_dict(self):
@@ -121,6 +257,9 @@ class Article:
             "embedding": self.embedding,
             "published": self.published,
             "source": self.source,
+            "language": self.language,
+            "duplicate_urls": self.duplicate_urls,
+            "summarized_at": self.summarized_at,
         }
 
     def save(self, ref):
@@ -149,3 +288,68 @@ class Article:
         doc_ref = ref.document(id)
         return doc_ref.get().exists
 
+    @staticmethod
+    def existing_ids(db, ref, ids: List[str]) -> set:
+        """
+        指定したIDのうち、既に保存されているものを1回のget_allでまとめて確認する。
+        """
+        if not ids:
+            return set()
+        doc_refs = [ref.document(id) for id in ids]
+        snapshots = db.get_all(doc_refs, field_paths=["id"])
+        return {snapshot.id for snapshot in snapshots if snapshot.exists}
+
+    @staticmethod
+    def get_many(db, ref, ids: List[str], field_paths: List[str] = None) -> dict:
+        """
+        指定したIDの記事を1回のget_allでまとめて取得し、IDごとに返す。存在しない記事は含まない。
+        """
+        if not ids:
+            return {}
+        doc_refs = [ref.document(id) for id in dict.fromkeys(ids)]
+        snapshots = db.get_all(doc_refs, field_paths=field_paths)
+        return {
+            snapshot.id: Article.from_dict(snapshot.to_dict())
+            for snapshot in snapshots
+            if snapshot.exists
+        }
+
+    @staticmethod
+    def link_duplicates(db, ref, links: dict) -> int:
+        """
+        {正規の記事ID: 重複する記事のURLのリスト} を受け取り、正規の記事のduplicate_urlsに追加する。
+        更新できた記事の件数を返す。
+        """
+        items = list(links.items())
+        linked = 0
+        for start in range(0, len(items), Article.WRITE_BATCH_LIMIT):
+            chunk = items[start : start + Article.WRITE_BATCH_LIMIT]
+            batch = db.batch()
+            for id, urls in chunk:
+                batch.update(
+                    ref.document(id), {"duplicate_urls": ArrayUnion(urls)}
+                )
+            try:
+                batch.commit()
+                linked += len(chunk)
+            except Exception as e:
+                print(f"[ERROR] Failed to link duplicates to {len(chunk)} articles: {e}")
+        return linked
+
+    @staticmethod
+    def bulk_save(db, ref, articles: List["Article"]) -> int:
+        """
+        WriteBatchを使い、上限の500件ごとにまとめて保存する。保存できた件数を返す。
+        """
+        saved = 0
+        for start in range(0, len(articles), Article.WRITE_BATCH_LIMIT):
+            chunk = articles[start : start + Article.WRITE_BATCH_LIMIT]
+            batch = db.batch()
+            for article in chunk:
+                batch.set(ref.document(article.id), article.to_dict())
+            try:
+                batch.commit()
+                saved += len(chunk)
+            except Exception as e:
+                print(f"[ERROR] Failed to save {len(chunk)} articles: {e}")
+        return saved
@@ -1,7 +1,8 @@
 import json
 import google.generativeai as genai
-from bs4 import BeautifulSoup
 import re
+from html_text_extractor import HtmlTextExtractor
+from main_content_extractor import MainContentExtractor
 
 CLEAN_TEXT_SCHEMA = {
     "type": "OBJECT",
@@ -32,13 +33,18 @@ class ArticleCleaner:
 
     def clean_text(self, raw_text: str):
         if "<" in raw_text and ">" in raw_text:
-            soup = BeautifulSoup(raw_text, "html.parser")
-            raw_text = soup.get_text(separator=" ").strip()
+            raw_text = HtmlTextExtractor.text(raw_text, separator=" ")
 
         raw_text = re.sub(r"\s+", " ", raw_text).strip()
 
         return raw_text
 
+    def extract_main_content(self, html: str, title: str):
+        """
+        LLMを使わずにHTMLから記事本文とキーワードを抽出する。llm_clean_textと同じ形式の辞書を返す。
+        """
+        return MainContentExtractor.extract(html, title)
+
     def llm_clean_text(self, raw_text: str, title: str):
         prompt = self.create_prompt(raw_text, title)
         response = self.model.generate_content(
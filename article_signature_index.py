@@ -0,0 +1,338 @@
+import argparse
+import hashlib
+import random
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from article import Article
+from lexical_index import tokenize
+
+# タイトル末尾のサイト名（'... | TechCrunch' など）。全角の'｜'はNFKCの正規化で'|'になる
+PIPE_SUFFIX_PATTERN = re.compile(r"\s*\|\s*[^|]+$")
+# '- The Verge' のような区切り文字の後の大文字で始まる短い語句。'- Part 2' のような連番は残す
+DASH_SUFFIX_PATTERN = re.compile(r"\s+[-–—]\s+(?:[A-Z][\w.&']*\s?){1,3}$")
+
+# MinHashの各ハッシュ関数 (a * x + b) mod PRIME の係数。プロセス間で同じ値になるよう乱数のシードを固定する
+MINHASH_PRIME = (1 << 61) - 1
+_random = random.Random(0)
+MINHASH_PERMUTATIONS = [
+    (_random.randrange(1, MINHASH_PRIME), _random.randrange(0, MINHASH_PRIME))
+    for _ in range(64)
+]
+
+
+class ArticleSignatureIndex:
+    """
+    記事タイトルのMinHashをFirestoreに保存し、別のURLで配信された同じ記事を検出する。
+    要約はフィードごとの定型文（Hacker Newsの 'Article URL: ... Points: ...' など）で大きく変わるため使わない。
+    64個の最小ハッシュ値を4つずつ16のバンドに分け（LSH）、バンドの値ごとのドキュメントに記事IDとMinHashを保存する。
+    いずれかのバンドが一致した記事のうち、MinHashから推定したJaccard類似度がTHRESHOLD以上のものを重複とみなす。
+    """
+
+    COLLECTION = "article_title_signatures"
+    NUM_PERM = len(MINHASH_PERMUTATIONS)
+    BANDS = 16
+    # Jaccard類似度0.6で約89%、0.3で約12%の確率でいずれかのバンドが一致する
+    THRESHOLD = 0.6
+    # 短いタイトルは別の記事どうしでも一致しやすいため判定しない（5語以上）
+    MIN_FEATURES = 9
+    # 定期的な投稿（'Weekly digest #12' など）を同じ記事とみなさないよう、公開日が近い記事とだけ比較する
+    WINDOW = timedelta(days=7)
+    # バンドのドキュメントを削除する日時のフィールド。FirestoreのTTLポリシーを設定して使う
+    TTL_FIELD = "expires_at"
+
+    @staticmethod
+    def collection(db: firestore.Client):
+        return db.collection(ArticleSignatureIndex.COLLECTION)
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        """
+        タイトル末尾のサイト名を除く。
+        """
+        title = unicodedata.normalize("NFKC", title or "").strip()
+        title = PIPE_SUFFIX_PATTERN.sub("", title)
+        return DASH_SUFFIX_PATTERN.sub("", title)
+
+    @staticmethod
+    def features(article: Article) -> List[str]:
+        """
+        タイトルのトークンと、トークンを2つずつ連結したshingleを返す。
+        短いタイトルでも語の追加や削除で類似度が大きく下がらないよう、トークン単体も含める。
+        """
+        tokens = tokenize(ArticleSignatureIndex.normalize_title(article.title))
+        return list(
+            dict.fromkeys(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+        )
+
+    @staticmethod
+    def minhash(features: List[str]) -> List[int]:
+        values = [
+            int.from_bytes(
+                hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"
+            )
+            for feature in features
+        ]
+        # 保存するサイズを抑えるため、最小値の下位32ビットだけを使う
+        return [
+            min((a * value + b) % MINHASH_PRIME for value in values) & 0xFFFFFFFF
+            for a, b in MINHASH_PERMUTATIONS
+        ]
+
+    @staticmethod
+    def similarity(a: List[int], b: List[int]) -> float:
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+    @staticmethod
+    def bucket_ids(signature: List[int]) -> List[str]:
+        rows = ArticleSignatureIndex.NUM_PERM // ArticleSignatureIndex.BANDS
+        bucket_ids = []
+        for band in range(ArticleSignatureIndex.BANDS):
+            values = signature[band * rows : (band + 1) * rows]
+            digest = hashlib.blake2b(
+                b"".join(value.to_bytes(4, "big") for value in values), digest_size=8
+            ).hexdigest()
+            bucket_ids.append(f"{band:02d}-{digest}")
+        return bucket_ids
+
+    @staticmethod
+    def _encode(signature: List[int]) -> str:
+        return "".join(f"{value:08x}" for value in signature)
+
+    @staticmethod
+    def _decode(value: str) -> List[int]:
+        return [int(value[i : i + 8], 16) for i in range(0, len(value), 8)]
+
+    @staticmethod
+    def _timestamp(published: datetime) -> float:
+        if published.tzinfo is None:
+            published = published.replace(tzinfo=timezone.utc)
+        return published.timestamp()
+
+    @staticmethod
+    def signatures(articles: List[Article]) -> Dict[str, List[int]]:
+        """
+        判定できる長さのタイトルを持つ記事のMinHashを記事IDごとに返す。
+        """
+        signatures = {}
+        for article in articles:
+            features = ArticleSignatureIndex.features(article)
+            if len(features) >= ArticleSignatureIndex.MIN_FEATURES:
+                signatures[article.id] = ArticleSignatureIndex.minhash(features)
+        return signatures
+
+    @staticmethod
+    def match(
+        articles: List[Article],
+        signatures: Dict[str, List[int]],
+        buckets: Dict[str, Dict[str, dict]],
+    ) -> Dict[str, str]:
+        """
+        各記事について、bucketsの記事または先に並んでいる記事に重複するものがあれば、その記事IDを返す。
+        bucketsには各記事のバンドのドキュメントの内容を渡す。
+        """
+        buckets = {bucket_id: dict(entries) for bucket_id, entries in buckets.items()}
+        duplicates = {}
+        for article in articles:
+            signature = signatures.get(article.id)
+            if signature is None:
+                continue
+            published = ArticleSignatureIndex._timestamp(article.published)
+            bucket_ids = ArticleSignatureIndex.bucket_ids(signature)
+            best_id, best_similarity = None, ArticleSignatureIndex.THRESHOLD
+            for bucket_id in bucket_ids:
+                for other_id, entry in buckets.get(bucket_id, {}).items():
+                    if other_id == article.id:
+                        continue
+                    other_published = ArticleSignatureIndex._timestamp(entry["published"])
+                    if (
+                        abs(published - other_published)
+                        > ArticleSignatureIndex.WINDOW.total_seconds()
+                    ):
+                        continue
+                    similarity = ArticleSignatureIndex.similarity(
+                        signature, ArticleSignatureIndex._decode(entry["signature"])
+                    )
+                    if similarity >= best_similarity:
+                        best_id, best_similarity = other_id, similarity
+            if best_id is not None:
+                duplicates[article.id] = best_id
+                continue
+            # 同じ実行で後に並んでいる記事がこの記事と重複していないかも判定できるようにする
+            for bucket_id in bucket_ids:
+                buckets.setdefault(bucket_id, {})[article.id] = {
+                    "signature": ArticleSignatureIndex._encode(signature),
+                    "published": article.published,
+                }
+        return duplicates
+
+    @staticmethod
+    def find_duplicates(db: firestore.Client, articles: List[Article]) -> Dict[str, str]:
+        """
+        各記事について、保存済みの記事または先に並んでいる記事に重複するものがあれば、その記事IDを返す。
+        バンドのドキュメントは1回のget_allでまとめて取得する。
+        """
+        signatures = ArticleSignatureIndex.signatures(articles)
+        if not signatures:
+            return {}
+
+        ref = ArticleSignatureIndex.collection(db)
+        bucket_ids = {
+            bucket_id
+            for signature in signatures.values()
+            for bucket_id in ArticleSignatureIndex.bucket_ids(signature)
+        }
+        buckets = {}
+        for snapshot in db.get_all([ref.document(id) for id in bucket_ids]):
+            if snapshot.exists:
+                buckets[snapshot.id] = snapshot.to_dict().get("articles", {})
+        return ArticleSignatureIndex.match(articles, signatures, buckets)
+
+    @staticmethod
+    def bulk_add(db: firestore.Client, articles: List[Article]) -> int:
+        """
+        記事のMinHashをバンドのドキュメントに追加する。追加した件数を返す。
+        今後の記事と比較する期間（WINDOW）を過ぎたドキュメントは、TTL_FIELDによりFirestoreが削除する。
+        """
+        ref = ArticleSignatureIndex.collection(db)
+        # 追加する記事の公開日はおおむね現在以前のため、現在からWINDOW後まで保持すれば比較に足りる
+        expires_at = datetime.now(timezone.utc) + ArticleSignatureIndex.WINDOW
+        signatures = ArticleSignatureIndex.signatures(articles)
+        entries = {}
+        for article in articles:
+            signature = signatures.get(article.id)
+            if signature is None:
+                continue
+            for bucket_id in ArticleSignatureIndex.bucket_ids(signature):
+                entries.setdefault(bucket_id, {})[article.id] = {
+                    "signature": ArticleSignatureIndex._encode(signature),
+                    "published": article.published,
+                }
+
+        bucket_ids = list(entries)
+        for start in range(0, len(bucket_ids), Article.WRITE_BATCH_LIMIT):
+            batch = db.batch()
+            for bucket_id in bucket_ids[start : start + Article.WRITE_BATCH_LIMIT]:
+                batch.set(
+                    ref.document(bucket_id),
+                    {
+                        "articles": entries[bucket_id],
+                        ArticleSignatureIndex.TTL_FIELD: expires_at,
+                    },
+                    merge=True,
+                )
+            batch.commit()
+        return len(signatures)
+
+    @staticmethod
+    def backfill(db: firestore.Client, days: int = WINDOW.days) -> int:
+        """
+        直近days日に公開された保存済みの記事のMinHashを追加する。追加した件数を返す。
+        重複の判定は公開日がWINDOW以内の記事とだけ行うため、導入時にWINDOWの期間だけ実行すればよい。
+        """
+        cutoff = datetime.now() - timedelta(days=days)
+        docs = (
+            Article.collection(db)
+            .where(filter=FieldFilter("published", ">=", cutoff))
+            .select(["id", "title", "url", "published"])
+            .stream()
+        )
+        articles = [Article.from_dict(doc.to_dict()) for doc in docs]
+        return ArticleSignatureIndex.bulk_add(db, articles)
+
+
+def self_check():
+    """
+    同じ記事の別のフィードからの配信が1件にまとまり、別の記事はまとまらないことを確認する。
+    """
+    published = datetime(2025, 1, 6, 10, tzinfo=timezone.utc)
+    title = "Mistral releases Codestral 2, an open-weight model for code completion"
+
+    def article(url: str, title: str, summary: str, hours: int = 0) -> Article:
+        return Article(
+            title=title,
+            summary=summary,
+            url=url,
+            published=published + timedelta(hours=hours),
+            language="en",
+        )
+
+    hacker_news = article(
+        "https://news.ycombinator.com/item?id=42600000",
+        title,
+        "Article URL: https://techcrunch.com/2025/01/06/mistral-codestral-2/ "
+        "Comments URL: https://news.ycombinator.com/item?id=42600000 "
+        "Points: 123 # Comments: 45",
+    )
+    techcrunch = article(
+        "https://techcrunch.com/2025/01/06/mistral-codestral-2/",
+        f"{title} | TechCrunch",
+        "Mistral has released Codestral 2, the second version of its code model, "
+        "with a larger context window and support for more than 80 languages.",
+        hours=2,
+    )
+    reworded = article(
+        "https://dev.to/someone/mistral-codestral-2",
+        title.replace("releases", "launches"),
+        "Mistral's new code model is out.",
+        hours=3,
+    )
+    other = article(
+        "https://techcrunch.com/2025/01/06/openai-o3-mini/",
+        "OpenAI releases o3-mini, a smaller reasoning model for developers | TechCrunch",
+        "OpenAI has released o3-mini.",
+        hours=1,
+    )
+    weekly = article(
+        "https://dev.to/someone/weekly-12",
+        "Weekly digest #12: what happened in open-weight models",
+        "",
+        hours=24 * 14,
+    )
+    weekly_next = article(
+        "https://dev.to/someone/weekly-13",
+        "Weekly digest #13: what happened in open-weight models",
+        "",
+        hours=24 * 22,
+    )
+    articles = [hacker_news, techcrunch, reworded, other, weekly, weekly_next]
+
+    signatures = ArticleSignatureIndex.signatures(articles)
+    duplicates = ArticleSignatureIndex.match(articles, signatures, {})
+    for article in articles[1:]:
+        similarity = ArticleSignatureIndex.similarity(
+            signatures[hacker_news.id], signatures[article.id]
+        )
+        print(
+            f"{article.title[:60]:60} similarity: {similarity:.2f}, "
+            f"duplicate of: {duplicates.get(article.id)}"
+        )
+
+    assert duplicates.get(techcrunch.id) == hacker_news.id
+    assert duplicates.get(reworded.id) == hacker_news.id
+    assert other.id not in duplicates
+    # 公開日がWINDOWより離れた定期的な投稿はまとめない
+    assert weekly_next.id not in duplicates
+    print("[INFO] Self check passed")
+
+
+if __name__ == "__main__":
+    # 使い方: python article_signature_index.py [--backfill [--days 7]]
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backfill", action="store_true", help="保存済みの記事のMinHashを追加する"
+    )
+    parser.add_argument("--days", type=int, default=ArticleSignatureIndex.WINDOW.days)
+    args = parser.parse_args()
+    if args.backfill:
+        from components import Components
+
+        count = ArticleSignatureIndex.backfill(Components.db(), days=args.days)
+        print(f"[INFO] Added article signatures: {count}")
+    else:
+        self_check()
@@ -0,0 +1,324 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import numpy as np
+from google.cloud.firestore_v1.base_query import FieldFilter
+from article import Article
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
+# 検索中に差し替わっても整合するよう、行列と記事のメタデータを一括で保持する
+# published（UNIX時刻、不明な場合はNaN）・sources・languagesは絞り込み用に行と同じ順で並べる
+IndexState = namedtuple(
+    "IndexState",
+    "matrix squared_norms docs positions published sources languages",
+)
+
+
+class ArticleVectorIndex:
+    """
+    記事のベクトルをメモリ上の行列に保持し、プロセス内で近傍検索を行う。
+    Firestoreを正とし、embedded_atが前回の取得以降の記事だけを差分で読み込む。
+    """
+
+    FIELDS = [
+        "id",
+        "title",
+        "summary",
+        "body",
+        "url",
+        "published",
+        "source",
+        "language",
+        "embedding",
+        "embedded_at",
+    ]
+    REFRESH_INTERVAL = 300  # 差分を取り込む間隔（秒）
+    # 書き込みの反映が前後しても取りこぼさないよう、前回の基準時刻より少し前から取得する
+    WATERMARK_OVERLAP = timedelta(minutes=2)
+    HYBRID_CANDIDATES = 20  # ベクトル検索と全文検索それぞれから統合対象とする件数
+    RECENCY_BOOST = 0.5  # 公開直後の記事のスコアを最大で1.5倍にする
+    RECENCY_HALF_LIFE_DAYS = 7
+    # Firestoreのfind_nearestと同じ距離の種類。DOT_PRODUCTのみ値が大きいほど近い
+    DISTANCE_MEASURES = ("EUCLIDEAN", "COSINE", "DOT_PRODUCT")
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._state = IndexState(
+            np.zeros((0, 0), dtype=np.float32),
+            np.zeros(0, dtype=np.float32),
+            [],
+            {},
+            np.zeros(0),
+            np.array([], dtype=object),
+            np.array([], dtype=object),
+        )
+        self.lexical = BM25Index()
+        self.watermark: datetime = None
+        self.loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def for_collection(collection) -> "ArticleVectorIndex":
+        """
+        ウォームインスタンス内で共有するコレクションごとのインデックスを返す。
+        """
+        with ArticleVectorIndex._instances_lock:
+            if collection.id not in ArticleVectorIndex._instances:
+                ArticleVectorIndex._instances[collection.id] = ArticleVectorIndex(collection)
+            return ArticleVectorIndex._instances[collection.id]
+
+    def _query(self):
+        query = self.collection.select(self.FIELDS)
+        if self.watermark is not None:
+            query = query.where(
+                filter=FieldFilter(
+                    "embedded_at", ">=", self.watermark - self.WATERMARK_OVERLAP
+                )
+            )
+        return query
+
+    @property
+    def size(self) -> int:
+        return len(self._state.docs)
+
+    def _upsert(self, docs: List[Dict]):
+        current = self._state.matrix
+        current_docs = self._state.docs
+        current_positions = self._state.positions
+        matrix = current
+        new_rows = []
+        new_docs = list(current_docs)
+        positions = dict(current_positions)
+        for doc in docs:
+            vector = np.asarray(list(doc.pop("embedding")), dtype=np.float32)
+            published = Article.published_datetime(doc.get("published"))
+            doc["published_ts"] = published.timestamp() if published else np.nan
+            if not doc.get("language"):
+                doc["language"] = Article.detect_language(
+                    f"{doc.get('title') or ''} {doc.get('summary') or ''}"
+                )
+            self.lexical.add(
+                doc["id"],
+                " ".join(
+                    doc.get(field) or "" for field in ("title", "summary", "body")
+                ),
+            )
+            if doc["id"] in positions:
+                # 再ベクトル化された記事は行を置き換える
+                row = positions[doc["id"]]
+                if matrix is current:
+                    matrix = matrix.copy()
+                matrix[row] = vector
+                new_docs[row] = doc
+            else:
+                positions[doc["id"]] = len(new_docs)
+                new_docs.append(doc)
+                new_rows.append(vector)
+        if new_rows:
+            rows = np.vstack(new_rows)
+            matrix = rows if matrix.size == 0 else np.vstack([matrix, rows])
+
+        self._state = IndexState(
+            matrix,
+            np.einsum("ij,ij->i", matrix, matrix),
+            new_docs,
+            positions,
+            np.array([doc["published_ts"] for doc in new_docs], dtype=np.float64),
+            np.array([doc.get("source") for doc in new_docs], dtype=object),
+            np.array([doc["language"] for doc in new_docs], dtype=object),
+        )
+
+    def refresh(self, force: bool = False):
+        if not force and time.monotonic() - self._last_refresh < self.REFRESH_INTERVAL:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.REFRESH_INTERVAL:
+                return
+            started = datetime.now(timezone.utc)
+            docs = []
+            watermark = self.watermark
+            for snapshot in self._query().stream():
+                data = snapshot.to_dict()
+                if not data or not data.get("embedding") or "id" not in data:
+                    continue
+                embedded_at = data.get("embedded_at")
+                if embedded_at and (watermark is None or embedded_at > watermark):
+                    watermark = embedded_at
+                docs.append(data)
+            if docs:
+                self._upsert(docs)
+            # embedded_atを持たない既存記事のみの場合は、読み込みを開始した時刻を基準にする
+            self.watermark = watermark if watermark is not None else started
+            self.loaded = True
+            self._last_refresh = time.monotonic()
+            print(
+                f"[INFO] Article vector index refreshed: +{len(docs)} (total {self.size})"
+            )
+
+    @staticmethod
+    def _filter_mask(
+        state: IndexState,
+        published_after: datetime = None,
+        source: str = None,
+        language: str = None,
+    ):
+        """
+        絞り込み条件に一致する行をTrueとする配列を返す。条件がなければNoneを返す。
+        """
+        mask = None
+        conditions = []
+        if published_after is not None:
+            published_after = Article.published_datetime(published_after)
+            # NaN（公開日時が不明）との比較はFalseになり、Firestoreと同じく対象外になる
+            conditions.append(state.published >= published_after.timestamp())
+        if source:
+            conditions.append(state.sources == source)
+        if language:
+            conditions.append(state.languages == language)
+        for condition in conditions:
+            mask = condition if mask is None else mask & condition
+        return mask
+
+    @staticmethod
+    def _nearest_rows(
+        state: IndexState,
+        query_vector,
+        k: int,
+        distance_measure: str = "EUCLIDEAN",
+        distance_threshold: float = None,
+        mask=None,
+    ):
+        """
+        近い順に最大k件の (行番号, 距離) を返す。距離はFirestoreのdistance_result_fieldと同じ値で、
+        DOT_PRODUCTの場合は内積（大きいほど近い）になる。
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        dots = state.matrix.dot(query)
+        if distance_measure == "EUCLIDEAN":
+            distances = np.sqrt(
+                np.maximum(state.squared_norms - 2 * dots + query.dot(query), 0.0)
+            )
+            ranks = distances
+        elif distance_measure == "COSINE":
+            norms = np.sqrt(state.squared_norms) * np.sqrt(query.dot(query))
+            distances = 1 - dots / np.where(norms > 0, norms, 1.0)
+            ranks = distances
+        elif distance_measure == "DOT_PRODUCT":
+            distances = dots
+            ranks = -dots
+        else:
+            raise ValueError(f"Unsupported distance measure: {distance_measure}")
+
+        ranks = ranks.astype(np.float64)
+        if mask is not None:
+            ranks[~mask] = np.inf
+        if distance_threshold is not None:
+            if distance_measure == "DOT_PRODUCT":
+                ranks[distances < distance_threshold] = np.inf
+            else:
+                ranks[distances > distance_threshold] = np.inf
+
+        k = min(k, int(np.isfinite(ranks).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(ranks, k - 1)[:k]
+        top = top[np.argsort(ranks[top])]
+        return [(int(row), float(distances[row])) for row in top]
+
+    def search(
+        self,
+        query_vector: List[float],
+        k: int = 3,
+        distance_measure: str = "EUCLIDEAN",
+        distance_threshold: float = None,
+        published_after: datetime = None,
+        source: str = None,
+        language: str = None,
+    ) -> List[Dict]:
+        """
+        指定した距離で近い順にk件の記事を返す。各記事にはdistanceを付与する。
+        published_after・source・languageで対象の記事を事前に絞り込む。
+        """
+        self.refresh()
+        state = self._state
+        if not state.docs:
+            return []
+        mask = self._filter_mask(state, published_after, source, language)
+        results = []
+        for row, distance in self._nearest_rows(
+            state, query_vector, k, distance_measure, distance_threshold, mask
+        ):
+            doc = dict(state.docs[row])
+            doc["distance"] = distance
+            results.append(doc)
+        return results
+
+    def _recency_factor(self, published, now: datetime) -> float:
+        published = Article.published_datetime(published)
+        if published is None:
+            return 1.0
+        age_days = max((now - published).total_seconds() / 86400, 0.0)
+        return 1 + self.RECENCY_BOOST * 0.5 ** (age_days / self.RECENCY_HALF_LIFE_DAYS)
+
+    def hybrid_search(
+        self,
+        query_vector: List[float],
+        query_text: str,
+        k: int = 3,
+        distance_measure: str = "EUCLIDEAN",
+        distance_threshold: float = None,
+        published_after: datetime = None,
+        source: str = None,
+        language: str = None,
+    ) -> List[Dict]:
+        """
+        ベクトル検索とBM25による全文検索の結果をReciprocal Rank Fusionで統合し、
+        公開日が新しい記事ほどスコアを高くしてk件を返す。各記事にはscoreを付与する。
+        絞り込み条件は両方の検索に適用し、distance_thresholdはベクトル検索の候補にのみ適用する。
+        """
+        self.refresh()
+        state = self._state
+        docs, positions = state.docs, state.positions
+        if not docs:
+            return []
+        mask = self._filter_mask(state, published_after, source, language)
+
+        vector_hits = self._nearest_rows(
+            state,
+            query_vector,
+            self.HYBRID_CANDIDATES,
+            distance_measure,
+            distance_threshold,
+            mask,
+        )
+        vector_ranking = [docs[row]["id"] for row, _ in vector_hits]
+        distances = {docs[row]["id"]: distance for row, distance in vector_hits}
+        # 絞り込む場合は、除外される記事の分だけ候補が減らないよう全件のスコアから選ぶ
+        lexical_hits = self.lexical.search(
+            query_text, k=None if mask is not None else self.HYBRID_CANDIDATES
+        )
+        lexical_ranking = [
+            doc_id
+            for doc_id, _ in lexical_hits
+            if doc_id in positions and (mask is None or mask[positions[doc_id]])
+        ][: self.HYBRID_CANDIDATES]
+
+        now = datetime.now(timezone.utc)
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking])
+        for doc_id in fused:
+            fused[doc_id] *= self._recency_factor(docs[positions[doc_id]].get("published"), now)
+
+        results = []
+        for doc_id in sorted(fused, key=fused.get, reverse=True)[:k]:
+            doc = dict(docs[positions[doc_id]])
+            doc["score"] = fused[doc_id]
+            if doc_id in distances:
+                doc["distance"] = distances[doc_id]
+            results.append(doc)
+        return results
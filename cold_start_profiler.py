@@ -0,0 +1,270 @@
+"""
+Cloud Functionsの各エントリポイントのコールドスタート時のimport時間を計測する。
+
+    python cold_start_profiler.py                 # 各エントリポイントの内訳を表示
+    python cold_start_profiler.py --check         # 予算を超えたエントリポイントがあれば終了コード1
+    python cold_start_profiler.py on_article_created --top 20
+
+`python -X importtime` の出力を集計するため、新しいプロセスでmain.pyと
+各関数で実行するimport文（main.pyとComponentsのファクトリを解析して取得する）を実行する。
+"""
+
+import argparse
+import ast
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MAIN_PATH = os.path.join(ROOT, "main.py")
+COMPONENTS_PATH = os.path.join(ROOT, "components.py")
+
+
+def _parse(path: str):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    return source, ast.parse(source)
+
+
+def _is_entry_point(node: ast.FunctionDef) -> bool:
+    return any(
+        isinstance(decorator, ast.Attribute) and decorator.attr == "cloud_event"
+        for decorator in node.decorator_list
+    )
+
+
+def _component_calls(node: ast.AST) -> List[str]:
+    """
+    nodeの中で呼び出すComponentsのメソッド名を返す。
+    """
+    return [
+        child.func.attr
+        for child in ast.walk(node)
+        if isinstance(child, ast.Call)
+        and isinstance(child.func, ast.Attribute)
+        and isinstance(child.func.value, ast.Name)
+        and child.func.value.id == "Components"
+    ]
+
+
+def _local_module_path(module: str) -> str:
+    """
+    リポジトリ内のモジュールであればファイルのパスを返す。そうでなければNoneを返す。
+    """
+    path = os.path.join(ROOT, *module.split("."))
+    for candidate in (f"{path}.py", os.path.join(path, "__init__.py")):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _imported_modules(node: ast.AST) -> List[str]:
+    modules = []
+    for child in ast.walk(node):
+        if isinstance(child, ast.Import):
+            modules.extend(alias.name for alias in child.names)
+        elif isinstance(child, ast.ImportFrom) and child.module:
+            modules.append(child.module)
+            # 'from agent import tools' のようにサブモジュールをimportする場合
+            modules.extend(f"{child.module}.{alias.name}" for alias in child.names)
+    return modules
+
+
+def component_imports(path: str = COMPONENTS_PATH) -> Dict[str, List[str]]:
+    """
+    components.pyを解析し、Componentsの各メソッドが初回の呼び出しで実行するimport文を返す。
+    メソッドの中で取得する他のコンポーネント（Components.genai()など）のimport文も含める。
+    """
+    source, tree = _parse(path)
+    methods = {
+        node.name: node
+        for cls in tree.body
+        if isinstance(cls, ast.ClassDef) and cls.name == "Components"
+        for node in cls.body
+        if isinstance(node, ast.FunctionDef)
+    }
+
+    def imports(name: str, visited: set) -> List[str]:
+        visited.add(name)
+        statements = [
+            ast.get_source_segment(source, node)
+            for node in ast.walk(methods[name])
+            if isinstance(node, (ast.Import, ast.ImportFrom))
+        ]
+        for called in _component_calls(methods[name]):
+            if called in methods and called not in visited:
+                statements.extend(imports(called, visited))
+        return statements
+
+    return {name: list(dict.fromkeys(imports(name, set()))) for name in methods}
+
+
+def _reachable_component_calls(node: ast.AST) -> List[str]:
+    """
+    nodeと、nodeからimportするリポジトリ内のモジュール（推移的に）で呼び出すComponentsのメソッド名を返す。
+    どの分岐で呼び出すかは区別しないため、実際のコールドスタートより多めに見積もる。
+    components.py自体は、呼び出したメソッドの分だけをcomponent_importsで数える。
+    """
+    calls = list(_component_calls(node))
+    pending = list(_imported_modules(node))
+    visited = {"components"}
+    while pending:
+        module = pending.pop()
+        if module in visited:
+            continue
+        visited.add(module)
+        path = _local_module_path(module)
+        if path is None:
+            continue
+        _, tree = _parse(path)
+        calls.extend(_component_calls(tree))
+        pending.extend(_imported_modules(tree))
+    return list(dict.fromkeys(calls))
+
+
+def entry_point_imports(path: str = MAIN_PATH) -> Dict[str, List[str]]:
+    """
+    main.pyを解析し、各エントリポイントで実行するimport文をエントリポイントごとに返す。
+    エントリポイントから呼び出すmain.pyの関数（_document_idなど）の中のimport文と、
+    エントリポイントやimportするモジュールから取得するComponentsのファクトリの中のimport文も含める。
+    """
+    source, tree = _parse(path)
+    functions = {
+        node.name: node for node in tree.body if isinstance(node, ast.FunctionDef)
+    }
+    components = component_imports()
+
+    def imports(name: str, visited: set) -> List[str]:
+        visited.add(name)
+        statements = []
+        for node in ast.walk(functions[name]):
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                statements.append(ast.get_source_segment(source, node))
+            elif (
+                isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Name)
+                and node.func.id in functions
+                and node.func.id not in visited
+            ):
+                statements.extend(imports(node.func.id, visited))
+        return statements
+
+    result = {}
+    for name, node in functions.items():
+        if not _is_entry_point(node):
+            continue
+        statements = imports(name, set())
+        for called in _reachable_component_calls(node):
+            statements.extend(components.get(called, []))
+        result[name] = list(dict.fromkeys(statements))
+    return result
+
+
+# 各エントリポイントで実行するimport文。main.pyとcomponents.pyから導出するため、手動で揃える必要はない
+ENTRY_POINT_IMPORTS = entry_point_imports()
+
+# エントリポイントごとのimport時間の上限（ミリ秒）
+BUDGETS_MS = {
+    "on_trend_update_started": 3000,
+    "on_article_created": 1500,
+    "on_embedding_backfill_started": 1500,
+    "on_question_created": 3000,
+}
+# BUDGETS_MSにないエントリポイント（main.pyに追加した関数など）の上限（ミリ秒）
+DEFAULT_BUDGET_MS = 3000
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _importtime(code: str) -> List[tuple]:
+    """
+    codeを新しいプロセスで実行し、(モジュール名, 累積時間[us], ネストの深さ) のリストを返す。
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    records = []
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            records.append(
+                (match.group(4), int(match.group(2)), len(match.group(3)) // 2)
+            )
+    return records
+
+
+def profile(entry_point: str, repeat: int = 3) -> Dict:
+    """
+    エントリポイントのimport時間を計測する。インタプリタの起動時に読み込まれるモジュールは除く。
+    repeat回計測し、合計時間が中央値の回の内訳を返す。
+    """
+    startup = {name for name, _, depth in _importtime("pass") if depth == 0}
+    code = "import main\n" + "".join(
+        f"{statement}\n" for statement in ENTRY_POINT_IMPORTS[entry_point]
+    )
+    # 1回目は.pycの生成を含むため計測に含めない
+    _importtime(code)
+
+    runs = []
+    for _ in range(repeat):
+        modules = [
+            (name, cumulative / 1000)
+            for name, cumulative, depth in _importtime(code)
+            if depth == 0 and name not in startup
+        ]
+        runs.append((sum(ms for _, ms in modules), modules))
+    runs.sort(key=lambda run: run[0])
+    total_ms, modules = runs[len(runs) // 2]
+    return {
+        "entry_point": entry_point,
+        "total_ms": total_ms,
+        "runs_ms": [run[0] for run in runs],
+        "modules": sorted(modules, key=lambda module: module[1], reverse=True),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINT_IMPORTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="表示するモジュール数")
+    parser.add_argument(
+        "--check", action="store_true", help="予算を超えた場合に終了コード1を返す"
+    )
+    parser.add_argument(
+        "--budget-ms", type=float, help="全エントリポイントに共通の予算（ミリ秒）"
+    )
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for entry_point in args.entry_points:
+        result = profile(entry_point, repeat=args.repeat)
+        budget = args.budget_ms or BUDGETS_MS.get(entry_point, DEFAULT_BUDGET_MS)
+        status = "OK" if result["total_ms"] <= budget else "OVER"
+        runs = ", ".join(f"{ms:.0f}" for ms in result["runs_ms"])
+        print(
+            f"[INFO] {entry_point}: {result['total_ms']:.0f} ms "
+            f"(budget {budget:.0f} ms, runs: {runs}) {status}"
+        )
+        for name, ms in result["modules"][: args.top]:
+            print(f"    {ms:9.1f} ms  {name}")
+        if status == "OVER":
+            over_budget.append(entry_point)
+
+    if over_budget:
+        print(f"[ERROR] Over cold start budget: {', '.join(over_budget)}")
+        if args.check:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import os
+import threading
+
+
+class Components:
+    """
+    ウォームインスタンス内の呼び出し間で共有するクライアントを、初回の利用時に一度だけ生成して保持する。
+    各モジュールのimportも初回の利用時まで遅らせる。
+    """
+
+    GEMINI_MODEL = "gemini-1.5-flash"
+    TOPIC_GEMINI_MODEL = "gemini-1.5-pro"
+
+    _instances = {}
+    # 生成処理の中で他のコンポーネントを取得するため、再入可能なロックを使う
+    _lock = threading.RLock()
+
+    @staticmethod
+    def _get(key, factory):
+        instance = Components._instances.get(key)
+        if instance is not None:
+            return instance
+        with Components._lock:
+            if key not in Components._instances:
+                Components._instances[key] = factory()
+            return Components._instances[key]
+
+    @staticmethod
+    def reset():
+        with Components._lock:
+            Components._instances.clear()
+
+    @staticmethod
+    def db():
+        def factory():
+            import firebase_admin
+            from firebase_admin import firestore
+
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app()
+            return firestore.client()
+
+        return Components._get("db", factory)
+
+    @staticmethod
+    def genai():
+        def factory():
+            import google.generativeai as genai
+
+            genai.configure(api_key=os.environ["GENAI_API_KEY"])
+            return genai
+
+        return Components._get("genai", factory)
+
+    @staticmethod
+    def openai():
+        def factory():
+            from openai import OpenAI
+
+            return OpenAI()
+
+        return Components._get("openai", factory)
+
+    @staticmethod
+    def query_embedding_cache(db=None):
+        """
+        検索クエリのベクトルキャッシュ。永続キャッシュにはdbのquery_embeddingsコレクションを使う。
+        """
+        db = db or Components.db()
+
+        def factory():
+            from query_embedding_cache import QueryEmbeddingCache
+
+            Components.genai()
+            return QueryEmbeddingCache(
+                collection=QueryEmbeddingCache.get_collection(db)
+            )
+
+        return Components._get(("query_embedding_cache", id(db)), factory)
+
+    @staticmethod
+    def web_searcher():
+        def factory():
+            from web_searcher import WebSearcher
+
+            return WebSearcher(
+                os.environ["GOOGLE_CUSTOM_SEARCH_API_KEY"],
+                os.environ["GOOGLE_SEARCH_CSE_ID"],
+            )
+
+        return Components._get("web_searcher", factory)
+
+    @staticmethod
+    def content_fetcher():
+        def factory():
+            from article_content_fetcher import ArticleContentFetcher
+
+            return ArticleContentFetcher()
+
+        return Components._get("content_fetcher", factory)
+
+    @staticmethod
+    def article_cleaner(model_name: str = GEMINI_MODEL):
+        def factory():
+            from article_cleaner import ArticleCleaner
+
+            Components.genai()
+            return ArticleCleaner(model_name)
+
+        return Components._get(("article_cleaner", model_name), factory)
+
+    @staticmethod
+    def summary_generator(model_name: str = GEMINI_MODEL):
+        def factory():
+            from article_summary_generator import ArticleSummaryGenerator
+
+            Components.genai()
+            return ArticleSummaryGenerator(model_name)
+
+        return Components._get(("summary_generator", model_name), factory)
+
+    @staticmethod
+    def topic_extractor(model_name: str = TOPIC_GEMINI_MODEL, db=None):
+        """
+        dbのarticlesとnewsコレクションを使うトピック抽出器。dbを省略すると既定のクライアントを使う。
+        """
+        db = db or Components.db()
+
+        def factory():
+            from article import Article
+            from news import News
+            from topic_extractor import TopicExtractor
+
+            Components.genai()
+            return TopicExtractor(
+                model_name=model_name,
+                db=db,
+                article_collection=Article.collection(db),
+                news_collection=News.get_collection(db),
+            )
+
+        return Components._get(("topic_extractor", model_name, id(db)), factory)
@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# 記事の署名のバンドのドキュメントを、expires_atの日時を過ぎたら削除するTTLポリシーを設定する
+# （ArticleSignatureIndex.COLLECTIONとTTL_FIELDに合わせる）
+gcloud firestore fields ttls update expires_at \
+  --collection-group=article_title_signatures \
+  --enable-ttl
@@ -0,0 +1,179 @@
+import math
+import re
+from typing import Dict, List
+from lexical_index import tokenize
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 文末（句点・感嘆符・疑問符・改行、または空白が続くピリオド）の直後で区切る
+PASSAGE_SPLIT_PATTERN = re.compile(r"(?<=[。！？!?\n])|(?<=\.)(?=\s)")
+
+
+class ContextPacker:
+    """
+    検索結果の記事をトークン数の上限内に収まるよう整形する。
+    関連度の高い記事ほど多くのトークンを割り当て、ほぼ同じ文は一度だけ含める。
+    """
+
+    MODEL = "gpt-4o-mini"
+    FALLBACK_ENCODING = "o200k_base"
+    TOKEN_BUDGET = 1500
+    DUPLICATE_THRESHOLD = 0.8  # 語の集合のJaccard係数がこれ以上の文は重複とみなす
+    MIN_DUPLICATE_TOKENS = 4  # これより短い文は完全一致のみ重複とみなす
+
+    _encoding = None
+    _encoding_loaded = False
+
+    @staticmethod
+    def encoding():
+        """
+        tiktokenのエンコーディングを返す。使えない場合はNoneを返し、文字数から概算する。
+        """
+        if not ContextPacker._encoding_loaded:
+            ContextPacker._encoding_loaded = True
+            if tiktoken is not None:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(ContextPacker.MODEL)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding(ContextPacker.FALLBACK_ENCODING)
+                    ContextPacker._encoding = encoding
+                except Exception as e:
+                    # 初回はBPEファイルをダウンロードするため、通信できない環境では失敗する
+                    print(f"[ERROR] Failed to load tiktoken encoding: {e}")
+        return ContextPacker._encoding
+
+    @staticmethod
+    def _char_tokens(char: str) -> float:
+        # tiktokenがない場合の概算。英数字は約4文字、日本語は約1文字で1トークン
+        return 0.25 if char.isascii() else 1.0
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        if not text:
+            return 0
+        encoding = ContextPacker.encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return math.ceil(sum(ContextPacker._char_tokens(c) for c in text))
+
+    @staticmethod
+    def truncate(text: str, max_tokens: int) -> str:
+        """
+        textの先頭からmax_tokens以内の部分を返す。
+        """
+        if max_tokens <= 0 or not text:
+            return ""
+        encoding = ContextPacker.encoding()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            # マルチバイト文字の途中で切れた場合の置換文字を除く
+            return encoding.decode(tokens[:max_tokens]).rstrip("\ufffd")
+        used = 0.0
+        for index, char in enumerate(text):
+            used += ContextPacker._char_tokens(char)
+            if used > max_tokens:
+                return text[:index]
+        return text
+
+    @staticmethod
+    def passages(text: str) -> List[str]:
+        """
+        文単位に分割する。分割した文を連結すると元のテキストに戻る。
+        """
+        if not text:
+            return []
+        return [p for p in PASSAGE_SPLIT_PATTERN.split(text) if p]
+
+    @staticmethod
+    def _is_duplicate(terms: set, seen: List[set]) -> bool:
+        if len(terms) < ContextPacker.MIN_DUPLICATE_TOKENS:
+            return terms in seen
+        for other in seen:
+            union = len(terms | other)
+            if union and len(terms & other) / union >= ContextPacker.DUPLICATE_THRESHOLD:
+                return True
+        return False
+
+    @staticmethod
+    def _unique_passages(text: str, seen: List[set]) -> List[str]:
+        passages = []
+        for passage in ContextPacker.passages(text):
+            terms = set(tokenize(passage))
+            if not terms:
+                continue
+            if ContextPacker._is_duplicate(terms, seen):
+                continue
+            seen.append(terms)
+            passages.append(passage)
+        return passages
+
+    @staticmethod
+    def _fill(passages: List[str], allowance: int):
+        """
+        割り当てたトークン数に収まるまで文を先頭から詰め、(テキスト, 使用したトークン数) を返す。
+        """
+        parts = []
+        used = 0
+        for passage in passages:
+            cost = ContextPacker.count_tokens(passage)
+            if used + cost > allowance:
+                partial = ContextPacker.truncate(passage, allowance - used)
+                if partial.strip():
+                    parts.append(partial)
+                    used += ContextPacker.count_tokens(partial)
+                break
+            parts.append(passage)
+            used += cost
+        return "".join(parts).strip(), used
+
+    @staticmethod
+    def pack(articles: List[Dict], token_budget: int = TOKEN_BUDGET) -> str:
+        """
+        記事のリスト（関連度の高い順）をtoken_budget以内のテキストにまとめる。
+        各記事のscoreがあればその比で、なければ順位の逆数の比で要約・本文のトークンを割り当てる。
+        """
+        seen = []
+        entries = []
+        remaining = token_budget
+        # scoreの尺度は順位の逆数と揃わないため、全件にある場合のみ使う
+        use_scores = bool(articles) and all(a.get("score") for a in articles)
+        for rank, article in enumerate(articles):
+            header = f"title: {article.get('title', '')}\nurl: {article.get('url', '')}\n"
+            cost = ContextPacker.count_tokens(header)
+            if cost > remaining:
+                break
+            remaining -= cost
+            weight = article["score"] if use_scores else 1 / (rank + 1)
+            summary = ContextPacker._unique_passages(article.get("summary") or "", seen)
+            body = ContextPacker._unique_passages(article.get("body") or "", seen)
+            entries.append(
+                {"header": header, "weight": weight, "summary": summary, "body": body}
+            )
+
+        # 関連度の高い記事から割り当て、使い切らなかった分は後続の記事に回す
+        total_weight = sum(entry["weight"] for entry in entries)
+        parts = []
+        for entry in entries:
+            allowance = (
+                int(remaining * entry["weight"] / total_weight) if total_weight else 0
+            )
+            total_weight -= entry["weight"]
+            parts.append(entry["header"])
+            for field in ("summary", "body"):
+                label = f"{field}: "
+                label_cost = ContextPacker.count_tokens(label)
+                if not entry[field] or allowance <= label_cost:
+                    continue
+                text, cost = ContextPacker._fill(entry[field], allowance - label_cost)
+                if text:
+                    parts.append(f"{label}{text}\n")
+                    allowance -= cost + label_cost
+                    remaining -= cost + label_cost
+            parts.append("\n")
+        return "".join(parts)
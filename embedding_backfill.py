@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List
+from firebase_admin import firestore
+from article import Article
+
+
+class EmbeddingBackfill:
+    """
+    articlesコレクション全体を記事IDの順にページングしてベクトル化する。
+    処理済みの位置をFirestoreに記録するため、中断しても続きから再開できる。
+    """
+
+    COLLECTION = "embedding_backfills"
+    PAGE_SIZE = 500
+    CONCURRENCY = 4
+
+    def __init__(
+        self,
+        db: firestore.Client,
+        job_id: str = None,
+        force: bool = True,
+        page_size: int = PAGE_SIZE,
+        concurrency: int = CONCURRENCY,
+    ):
+        self.db = db
+        self.article_collection = Article.collection(db)
+        # モデル変更時に別ジョブとして最初からやり直せるよう、既定のIDにモデル名を含める
+        self.job_id = job_id if job_id else Article.EMBEDDING_MODEL.split("/")[-1]
+        self.force = force
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.progress_ref = db.collection(self.COLLECTION).document(self.job_id)
+
+    def _load_progress(self) -> dict:
+        doc = self.progress_ref.get()
+        if doc.exists:
+            return doc.to_dict()
+        return {"cursor": None, "processed": 0, "completed": False}
+
+    def _save_progress(self, cursor: str, processed: int, completed: bool):
+        self.progress_ref.set(
+            {
+                "job_id": self.job_id,
+                "model": Article.EMBEDDING_MODEL,
+                "cursor": cursor,
+                "processed": processed,
+                "completed": completed,
+                "updated": datetime.now(),
+            }
+        )
+
+    def _fetch_page(self, cursor: str) -> List[Article]:
+        query = self.article_collection.order_by("id")
+        if cursor:
+            query = query.start_after({"id": cursor})
+        docs = query.limit(self.page_size).stream()
+        return [Article.from_dict(doc.to_dict()) for doc in docs]
+
+    def _vectorize_page(self, articles: List[Article]) -> int:
+        groups = [
+            articles[start : start + Article.EMBED_BATCH_SIZE]
+            for start in range(0, len(articles), Article.EMBED_BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            counts = executor.map(
+                lambda group: Article.vectorize_many(
+                    self.db, self.article_collection, group, force=self.force
+                ),
+                groups,
+            )
+            return sum(counts)
+
+    def run(self, max_pages: int = None) -> dict:
+        progress = self._load_progress()
+        if progress.get("completed"):
+            print(f"[INFO] Embedding backfill '{self.job_id}' already completed.")
+            return progress
+
+        cursor = progress.get("cursor")
+        processed = progress.get("processed", 0)
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            articles = self._fetch_page(cursor)
+            if not articles:
+                self._save_progress(cursor, processed, completed=True)
+                print(f"[INFO] Embedding backfill '{self.job_id}' completed: {processed}")
+                return self._load_progress()
+
+            processed += self._vectorize_page(articles)
+            cursor = articles[-1].id
+            pages += 1
+            self._save_progress(cursor, processed, completed=False)
+            print(f"[INFO] Embedding backfill '{self.job_id}': {processed} (cursor: {cursor})")
+
+        return self._load_progress()
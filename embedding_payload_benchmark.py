@@ -0,0 +1,76 @@
+"""
+Article.to_json_for_embeddingの処理時間とjson.dumpsの呼び出し回数を計測する。
+
+    python embedding_payload_benchmark.py          # 10 KBと100 KBの本文で計測
+    python embedding_payload_benchmark.py 1000     # 本文のサイズ(KB)を指定
+"""
+
+import json
+import sys
+import time
+from typing import List
+from unittest import mock
+
+from article import Article
+
+
+def benchmark(sizes_kb: List[int] = None, repeat: int = 20):
+    """
+    本文の長さと文字種ごとに、to_json_for_embeddingの処理時間とjson.dumpsの呼び出し回数を計測する。
+    比較のため、100文字ずつ削っては全体を再シリアライズする以前の方式も計測する。
+    """
+    sizes_kb = sizes_kb or [10, 100]
+    samples = {
+        "ascii": "The quick brown fox jumps over the lazy dog. ",
+        "japanese": "日本語の技術記事の本文です。",
+        "escaped": 'He said "hi"\n\t\\ ',
+    }
+
+    def legacy(data: dict) -> str:
+        while True:
+            json_data = json.dumps(data, ensure_ascii=False)
+            if len(json_data.encode("utf-8")) <= Article.BYTE_LIMIT:
+                return json_data
+            for field in ("body", "summary", "title"):
+                if data[field]:
+                    data[field] = data[field][: len(data[field]) - 100]
+                    break
+
+    for size_kb in sizes_kb:
+        for name, sample in samples.items():
+            body = (sample * (size_kb * 1024 // len(sample.encode("utf-8")) + 1))[
+                : size_kb * 1024
+            ]
+            article = Article(
+                title="タイトル",
+                summary="要約",
+                url="https://example.com",
+                body=body,
+                language="ja",
+            )
+            with mock.patch("json.dumps", wraps=json.dumps) as dumps:
+                payload = article.to_json_for_embedding()
+            size = len(payload.encode("utf-8"))
+            assert size <= Article.BYTE_LIMIT and json.loads(payload)
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                article.to_json_for_embedding()
+            elapsed = (time.perf_counter() - started) / repeat
+
+            # 以前の方式は長い本文では遅すぎるため、1回だけ計測する
+            data = {"title": article.title, "summary": article.summary, "body": body}
+            started = time.perf_counter()
+            legacy(data)
+            legacy_elapsed = time.perf_counter() - started
+
+            print(
+                f"{size_kb} KB {name}: {elapsed * 1000:.2f} ms, "
+                f"{dumps.call_count} json.dumps calls, {size} bytes "
+                f"(legacy: {legacy_elapsed * 1000:.1f} ms)"
+            )
+
+
+if __name__ == "__main__":
+    # 使い方: python embedding_payload_benchmark.py [本文のサイズ(KB) ...]
+    benchmark([int(size) for size in sys.argv[1:]] or None)
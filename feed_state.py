@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import Dict, List
+from firebase_admin import firestore
+from article import Article
+
+
+class FeedState:
+    """
+    RSSフィードの条件付きGET用の状態（ETag、Last-Modified、既読エントリ）を保持する。
+    """
+
+    COLLECTION = "feed_states"
+
+    def __init__(
+        self,
+        url: str,
+        etag: str = None,
+        modified: str = None,
+        seen_entry_ids: List[str] = None,
+        updated: datetime = None,
+        id: str = None,
+    ):
+        self.id = id if id else Article.create_id(url)
+        self.url = url
+        self.etag = etag
+        self.modified = modified
+        self.seen_entry_ids = seen_entry_ids if seen_entry_ids else []
+        self.updated = updated if updated else datetime.now()
+
+    @staticmethod
+    def from_dict(source):
+        return FeedState(
+            id=source.get("id"),
+            url=source.get("url", ""),
+            etag=source.get("etag"),
+            modified=source.get("modified"),
+            seen_entry_ids=source.get("seen_entry_ids", []),
+            updated=source.get("updated", datetime.now()),
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "etag": self.etag,
+            "modified": self.modified,
+            "seen_entry_ids": self.seen_entry_ids,
+            "updated": self.updated,
+        }
+
+    def request_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
+
+    @staticmethod
+    def collection(db: firestore.Client):
+        return db.collection(FeedState.COLLECTION)
+
+    @staticmethod
+    def get_all(db: firestore.Client, urls: List[str]) -> Dict[str, "FeedState"]:
+        """
+        指定したフィードの状態を1回のget_allでまとめて取得する。未保存のフィードは新規の状態を返す。
+        """
+        ref = FeedState.collection(db)
+        states = {url: FeedState(url) for url in urls}
+        url_by_id = {state.id: url for url, state in states.items()}
+        doc_refs = [ref.document(state.id) for state in states.values()]
+        for snapshot in db.get_all(doc_refs):
+            if snapshot.exists:
+                url = url_by_id[snapshot.id]
+                states[url] = FeedState.from_dict(snapshot.to_dict())
+        return states
+
+    @staticmethod
+    def bulk_save(db: firestore.Client, states: List["FeedState"]):
+        ref = FeedState.collection(db)
+        batch = db.batch()
+        for state in states:
+            state.updated = datetime.now()
+            batch.set(ref.document(state.id), state.to_dict())
+        batch.commit()
@@ -0,0 +1,45 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class HostScheduler:
+    """
+    ホストごとの同時接続数とアクセス間隔を制御する。
+    同じサイトへの連続アクセスを呼び出し順ではなくスケジューラで防ぐ。
+    """
+
+    def __init__(self, max_per_host: int = 2, min_interval: float = 1.0):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    def _semaphore(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _reserve_delay(self, host: str) -> float:
+        # 次にアクセスしてよい時刻を予約し、それまでの待ち時間を返す
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+            return slot - now
+
+    @contextmanager
+    def slot(self, url: str):
+        host = self.host(url)
+        with self._semaphore(host):
+            delay = self._reserve_delay(host)
+            if delay > 0:
+                time.sleep(delay)
+            yield
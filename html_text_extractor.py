@@ -0,0 +1,192 @@
+import os
+import re
+import sys
+import time
+import tracemalloc
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Tuple
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+# BeautifulSoupのget_textと同じく、これらのタグ内の文字列は本文として扱わない
+IGNORED_TAGS = ["script", "style", "template"]
+
+
+def _selectolax_paragraphs(html: str) -> str:
+    tree = SelectolaxParser(html)
+    tree.strip_tags(IGNORED_TAGS)
+    return "".join([p.text(deep=True).strip() for p in tree.css("p")])
+
+
+def _selectolax_text(html: str, separator: str) -> str:
+    tree = SelectolaxParser(html)
+    tree.strip_tags(IGNORED_TAGS)
+    if tree.root is None:
+        return ""
+    return tree.root.text(deep=True, separator=separator).strip()
+
+
+def _lxml_document(html: str):
+    doc = lxml.html.fromstring(html)
+    etree.strip_elements(doc, *IGNORED_TAGS, etree.Comment, with_tail=False)
+    return doc
+
+
+def _lxml_paragraphs(html: str) -> str:
+    doc = _lxml_document(html)
+    return "".join([p.text_content().strip() for p in doc.iter("p")])
+
+
+def _lxml_text(html: str, separator: str) -> str:
+    doc = _lxml_document(html)
+    return separator.join(doc.itertext()).strip()
+
+
+def _bs4_paragraphs(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    return "".join([p.get_text().strip() for p in soup.find_all("p")])
+
+
+def _bs4_text(html: str, separator: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.get_text(separator=separator).strip()
+
+
+class HtmlTextExtractor:
+    """
+    HTMLからテキストを抽出する。selectolax、lxmlがインストールされていれば高速な実装を使い、
+    なければBeautifulSoupのhtml.parserにフォールバックする。
+    """
+
+    FALLBACK_BACKEND = "html.parser"
+    BACKENDS: Dict[str, Tuple[Callable, Callable]] = {}
+    if SelectolaxParser is not None:
+        BACKENDS["selectolax"] = (_selectolax_paragraphs, _selectolax_text)
+    if lxml is not None:
+        BACKENDS["lxml"] = (_lxml_paragraphs, _lxml_text)
+    BACKENDS[FALLBACK_BACKEND] = (_bs4_paragraphs, _bs4_text)
+
+    # 環境変数で明示的にバックエンドを切り替えられる
+    backend = os.environ.get("HTML_EXTRACTOR_BACKEND", next(iter(BACKENDS)))
+    if backend not in BACKENDS:
+        backend = FALLBACK_BACKEND
+
+    @staticmethod
+    def _run(index: int, html: str, *args) -> str:
+        backend = HtmlTextExtractor.backend
+        try:
+            return HtmlTextExtractor.BACKENDS[backend][index](html, *args)
+        except Exception:
+            if backend == HtmlTextExtractor.FALLBACK_BACKEND:
+                raise
+            # 高速な実装が解析できない入力（エンコーディング宣言付きの文字列など）はhtml.parserで処理する
+            fallback = HtmlTextExtractor.BACKENDS[HtmlTextExtractor.FALLBACK_BACKEND]
+            return fallback[index](html, *args)
+
+    @staticmethod
+    def paragraphs(html: str) -> str:
+        """
+        <p>要素のテキストを前後の空白を除いて連結する。
+        """
+        return HtmlTextExtractor._run(0, html)
+
+    @staticmethod
+    def text(html: str, separator: str = " ") -> str:
+        """
+        HTML全体のテキストをseparatorで連結する。
+        """
+        return HtmlTextExtractor._run(1, html, separator)
+
+
+class ParagraphCollector(HTMLParser):
+    """
+    チャンクごとにHTMLを受け取り、<p>要素のテキストを逐次収集するパーサー。
+    空白をまとめた後の文字数がmax_charsに達した時点でdoneがTrueになる。
+    """
+
+    def __init__(self, max_chars: int = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.paragraphs = []
+        self.length = 0
+        self._buffer = None
+        self._ignored_depth = 0
+
+    @property
+    def done(self) -> bool:
+        return self.max_chars is not None and self.length >= self.max_chars
+
+    def _flush(self):
+        if self._buffer is None:
+            return
+        text = "".join(self._buffer).strip()
+        self._buffer = None
+        if text:
+            self.paragraphs.append(text)
+            self.length += len(re.sub(r"\s+", " ", text))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in IGNORED_TAGS:
+            self._ignored_depth += 1
+        elif tag == "p":
+            # 閉じられていない<p>は次の<p>の開始で閉じる
+            self._flush()
+            self._buffer = []
+
+    def handle_endtag(self, tag):
+        if tag in IGNORED_TAGS:
+            self._ignored_depth = max(0, self._ignored_depth - 1)
+        elif tag == "p":
+            self._flush()
+
+    def handle_data(self, data):
+        if self._buffer is not None and not self._ignored_depth:
+            self._buffer.append(data)
+
+    def text(self) -> str:
+        self._flush()
+        return "".join(self.paragraphs)
+
+
+def benchmark(paths: List[str], repeat: int = 5):
+    """
+    保存済みHTMLを使い、バックエンドごとのスループットとピークメモリを比較する。
+    ピークメモリはtracemallocで計測するため、Cライブラリ内部の確保は含まれない。
+    """
+    corpus = [open(path, encoding="utf-8", errors="replace").read() for path in paths]
+    total_mb = sum(len(html.encode("utf-8")) for html in corpus) / 1024 / 1024
+    expected = [_bs4_paragraphs(html) for html in corpus]
+
+    for name, (paragraphs, _) in HtmlTextExtractor.BACKENDS.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            results = [paragraphs(html) for html in corpus]
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        for html in corpus:
+            paragraphs(html)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        mismatches = sum(1 for a, b in zip(results, expected) if a != b)
+        print(
+            f"{name}: {total_mb * repeat / elapsed:.2f} MB/s, "
+            f"peak {peak / 1024:.0f} KiB, "
+            f"{mismatches}/{len(corpus)} outputs differ from html.parser"
+        )
+
+
+if __name__ == "__main__":
+    # 使い方: python html_text_extractor.py saved_pages/*.html
+    benchmark(sys.argv[1:])
@@ -0,0 +1,89 @@
+import re
+from collections import Counter
+from typing import List
+
+# 'GitHub'、'GPT-4o'、'DeepSeek R1' のような英数字の固有名詞（複数語の連続を含む）
+_WORD = r"(?:[A-Z][A-Za-z0-9.+#-]*|[a-z]+[A-Z][A-Za-z0-9.+#-]*|[A-Za-z]*[0-9][A-Za-z0-9.+#-]*)"
+PROPER_NOUN_PATTERN = re.compile(rf"{_WORD}(?:[ \t]+{_WORD})*")
+# 'クロード' のようなカタカナの固有名詞
+KATAKANA_PATTERN = re.compile(r"[ァ-ヴー]{3,}")
+
+# 固有名詞ではない、または抽象的すぎる語
+STOPWORDS = set(
+    "a an and the in on of for to with by from how what why when who where which "
+    "this that these i we you it my our your is are be new show ask hn tell ai api "
+    "llm llms ui ux os id pdf http https url html css faq ceo cto pr q vs".split()
+)
+GENERIC_KATAKANA = set(
+    "テスト サービス ツール システム データ エンジニア プログラミング アプリ "
+    "アプリケーション ユーザー サーバー クラウド セキュリティ モデル エージェント "
+    "プロジェクト チーム コード ライブラリ フレームワーク インフラ ニュース イベント "
+    "リリース アップデート".split()
+)
+
+
+class KeywordExtractor:
+    """
+    LLMを使わずに、タイトルと本文から固有名詞の候補を抽出する。
+    """
+
+    @staticmethod
+    def normalize(term: str) -> str:
+        return re.sub(r"[\s\-_]+", " ", term).strip().lower()
+
+    @staticmethod
+    def _strip_stopwords(term: str) -> str:
+        words = term.split()
+        while words and words[0].lower() in STOPWORDS:
+            words = words[1:]
+        while words and words[-1].lower() in STOPWORDS:
+            words = words[:-1]
+        return " ".join(words).strip(".-+#")
+
+    @staticmethod
+    def candidates(text: str) -> List[str]:
+        """
+        テキストに含まれる固有名詞の候補を出現順に返す（重複を含む）。
+        """
+        if not text:
+            return []
+        terms = []
+        for match in PROPER_NOUN_PATTERN.finditer(text):
+            term = KeywordExtractor._strip_stopwords(match.group(0))
+            if (
+                len(term) >= 2
+                and term.lower() not in STOPWORDS
+                and not re.fullmatch(r"[\d.,-]+", term)
+            ):
+                terms.append(term)
+        for match in KATAKANA_PATTERN.finditer(text):
+            term = match.group(0)
+            if term not in GENERIC_KATAKANA:
+                terms.append(term)
+        return terms
+
+    @staticmethod
+    def dominant(title: str, text: str = "") -> str:
+        """
+        タイトルと本文で最も中心的な固有名詞をひとつ返す。見つからなければ空文字を返す。
+        """
+        title_terms = KeywordExtractor.candidates(title)
+        scores = Counter()
+        surfaces = {}
+        for term in KeywordExtractor.candidates(text):
+            key = KeywordExtractor.normalize(term)
+            scores[key] += 1
+            surfaces.setdefault(key, term)
+        for term in title_terms:
+            key = KeywordExtractor.normalize(term)
+            # タイトルに含まれる語を優先する
+            scores[key] += 3
+            surfaces[key] = term
+        if not scores:
+            return ""
+        # 'DeepSeek R1' のような複数語の名前は単語単体より具体的なので加点する
+        best = max(
+            scores,
+            key=lambda key: (scores[key] * (1.5 if " " in key else 1.0), len(key)),
+        )
+        return surfaces[best]
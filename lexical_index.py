@@ -0,0 +1,94 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Tuple
+
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9.+#_-]*")
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    英数字は単語単位、日本語（かな・漢字）は文字bigramに分割する。
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = [word.strip(".-_") for word in WORD_PATTERN.findall(text)]
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return [token for token in tokens if token]
+
+
+class BM25Index:
+    """
+    記事のタイトル・要約・本文に対するBM25の転置インデックス。
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, doc_id: str):
+        for term in self.doc_terms.pop(doc_id, []):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+    def add(self, doc_id: str, text: str):
+        """
+        文書を追加する。同じIDの文書があれば置き換える。
+        """
+        tokens = tokenize(text)
+        terms = Counter(tokens)
+        with self._lock:
+            self._remove(doc_id)
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            self.doc_terms[doc_id] = list(terms)
+            self.doc_lengths[doc_id] = len(tokens)
+            self.total_length += len(tokens)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        query_terms = set(tokenize(query))
+        scores = Counter()
+        with self._lock:
+            doc_count = len(self.doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self.total_length / doc_count
+            for term in query_terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    length_norm = 1 - self.B + self.B * self.doc_lengths[doc_id] / average_length
+                    scores[doc_id] += idf * tf * (self.K1 + 1) / (tf + self.K1 * length_norm)
+        return scores.most_common(k)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """
+    複数の順位リストをReciprocal Rank Fusionで統合したスコアを返す。
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1 / (k + rank + 1)
+    return dict(scores)
@@ -1,34 +1,25 @@
 import os
+import base64
+import json
 from cloudevents.http import CloudEvent
 import functions_framework
-from google.events.cloud import firestore as firestore_event
-import firebase_admin
-from firebase_admin import firestore
-import google.generativeai as genai
-from openai import OpenAI
-from rss_article_uploader import RssArticleUploader
-from article import Article
-from article_cleaner import ArticleCleaner
-from user import User
-from question import Question, ANSWER_STATUS
-from answer_agent import AnswerAgent
-from web_searcher import WebSearcher
-from news_generation_agent import NewsGenerationAgent
-
-# GenAI 初期化
-genai.configure(api_key=os.environ["GENAI_API_KEY"])
-
-# OpenAI 初期化
-client = OpenAI()
-
-# Firestore 初期化
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
-db = firestore.client()
-
-# Google Custom Search
-google_custom_search_api_key = os.environ["GOOGLE_CUSTOM_SEARCH_API_KEY"]
-google_search_cse_id = os.environ["GOOGLE_SEARCH_CSE_ID"]
+from components import Components
+
+# 各関数のコールドスタートを短くするため、モジュールのimportとクライアントの初期化は
+# それぞれの関数で必要になった時点で行う（cold_start_profiler.pyで計測できる）
+
+# "batch"の場合、記事作成時にはベクトル化せずon_embedding_backfill_startedでまとめて処理する
+embedding_mode = os.environ.get("EMBEDDING_MODE", "realtime")
+
+
+def _document_id(cloud_event: CloudEvent) -> str:
+    from google.events.cloud import firestore as firestore_event
+
+    doc_event_data = firestore_event.DocumentEventData()
+    doc_event_data._pb.ParseFromString(cloud_event.data)
+
+    doc_path = doc_event_data.value.name
+    return doc_path.split("/")[-1]
 
 
 @functions_framework.cloud_event
@@ -36,14 +27,17 @@ def on_trend_update_started(cloud_event):
     """
     trend-updatesトピックにメッセージが送信された時に実行
     """
+    from rss_article_uploader import RssArticleUploader
+    from news_generation_agent import NewsGenerationAgent
+
+    db = Components.db()
     uploader = RssArticleUploader("gemini-1.5-flash", db)
     uploader.bulk_upload()
 
-    web_searcher = WebSearcher(google_custom_search_api_key, google_search_cse_id)
-    generator = NewsGenerationAgent(db=db, web_searcher=web_searcher)
+    generator = NewsGenerationAgent(db=db, web_searcher=Components.web_searcher())
     topic = generator.extract_topic()
-    for language_code in ["ja", "en"]:
-        news = generator.create(language_code, topic=topic)
+    news_by_language = generator.create_many(["ja", "en"], topic=topic)
+    for language_code, news in news_by_language.items():
         print(f"[INFO] Created news - {language_code}: {news.content}")
 
 
@@ -52,37 +46,71 @@ def on_article_created(cloud_event: CloudEvent) -> None:
     """
     articlesコレクションに新規ドキュメントが追加された時に実行
     """
-    print(f"Triggered by creation of a document: {cloud_event['source']}")
-
-    doc_event_data = firestore_event.DocumentEventData()
-    doc_event_data._pb.ParseFromString(cloud_event.data)
+    from article import Article
 
-    doc_path = doc_event_data.value.name
-    doc_id = doc_path.split("/")[-1]
+    print(f"Triggered by creation of a document: {cloud_event['source']}")
+    doc_id = _document_id(cloud_event)
 
+    db = Components.db()
     article_collection = Article.collection(db)
     article = Article.get(article_collection, doc_id)
 
-    article.import_body(article_collection, ArticleCleaner("gemini-1.5-flash"))
+    article.import_body(article_collection, Components.article_cleaner())
+    if embedding_mode == "batch":
+        print(f"[INFO] Article body imported: {article.title}")
+        return
+    Components.genai()
     article.vectorize(article_collection)
 
     print(f"[INFO] Article vectorize success: {article.title}")
 
 
+@functions_framework.cloud_event
+def on_embedding_backfill_started(cloud_event: CloudEvent) -> None:
+    """
+    embedding-backfillトピックにメッセージが送信された時に実行
+    メッセージ例: {"mode": "pending"} または {"mode": "backfill", "job_id": "...", "force": true}
+    """
+    params = {}
+    message_data = cloud_event.data.get("message", {}).get("data")
+    if message_data:
+        params = json.loads(base64.b64decode(message_data).decode("utf-8"))
+
+    from article import Article
+    from embedding_backfill import EmbeddingBackfill
+
+    Components.genai()
+    db = Components.db()
+    article_collection = Article.collection(db)
+    if params.get("mode", "pending") == "pending":
+        articles = Article.get_pending_embeddings(article_collection)
+        count = Article.vectorize_many(db, article_collection, articles)
+        print(f"[INFO] Vectorized pending articles: {count}")
+        return
+
+    backfill = EmbeddingBackfill(
+        db,
+        job_id=params.get("job_id"),
+        force=params.get("force", True),
+    )
+    progress = backfill.run(max_pages=params.get("max_pages"))
+    print(f"[INFO] Embedding backfill progress: {progress}")
+
+
 @functions_framework.cloud_event
 def on_question_created(cloud_event: CloudEvent) -> None:
     """
     questionsコレクションに新規ドキュメントが追加された時に実行
     """
-    print(f"Triggered by creation of a document: {cloud_event['source']}")
-
-    doc_event_data = firestore_event.DocumentEventData()
-    doc_event_data._pb.ParseFromString(cloud_event.data)
+    from user import User
+    from question import Question, ANSWER_STATUS
+    from answer_agent import AnswerAgent
 
-    doc_path = doc_event_data.value.name
-    user_id = doc_path.split("/")[-1]
+    print(f"Triggered by creation of a document: {cloud_event['source']}")
+    user_id = _document_id(cloud_event)
     print(f"user_id: {user_id}")
 
+    db = Components.db()
     question_ref = Question.collection(db)
     question = Question.get(question_ref, user_id)
 
@@ -97,8 +125,7 @@ def on_question_created(cloud_event: CloudEvent) -> None:
 
     agent_answer = ""
     try:
-        web_searcher = WebSearcher(google_custom_search_api_key, google_search_cse_id)
-        answer_agent = AnswerAgent(db=db, web_searcher=web_searcher)
+        answer_agent = AnswerAgent(db=db, web_searcher=Components.web_searcher())
         agent_answer = answer_agent.answer(
             user_id=user_id, question=question.question_text
         )
@@ -0,0 +1,167 @@
+import re
+from typing import Dict
+from bs4 import BeautifulSoup
+from keyword_extractor import KeywordExtractor
+
+try:
+    import lxml  # noqa: F401
+
+    SOUP_PARSER = "lxml"
+except ImportError:
+    SOUP_PARSER = "html.parser"
+
+# 本文になり得ない要素
+REMOVE_TAGS = (
+    "script style noscript template iframe form nav header footer aside svg "
+    "button select input figure".split()
+)
+UNLIKELY_PATTERN = re.compile(
+    r"comment|sidebar|footer|header|nav|menu|share|social|related|recommend|promo|"
+    r"advert|\bads?\b|\bad-|banner|cookie|popup|modal|subscribe|newsletter|breadcrumb|pager|widget",
+    re.I,
+)
+POSITIVE_PATTERN = re.compile(
+    r"article|body|content|entry|main|post|text|story|blog|hentry", re.I
+)
+NEGATIVE_PATTERN = re.compile(
+    r"comment|meta|footer|footnote|sidebar|sponsor|share|social|related|tag|author|"
+    r"promo|advert|widget|hidden",
+    re.I,
+)
+PARAGRAPH_TAGS = ["p", "pre", "blockquote"]
+TAG_WEIGHTS = {
+    "article": 10,
+    "main": 10,
+    "div": 5,
+    "section": 3,
+    "pre": 3,
+    "td": 3,
+    "blockquote": 3,
+    "ol": -3,
+    "ul": -3,
+    "li": -3,
+    "dl": -3,
+    "dd": -3,
+    "dt": -3,
+    "h1": -5,
+    "h2": -5,
+    "h3": -5,
+    "h4": -5,
+    "h5": -5,
+    "h6": -5,
+    "th": -5,
+}
+MIN_PARAGRAPH_LENGTH = 25
+
+
+class MainContentExtractor:
+    """
+    Readabilityと同様のヒューリスティックで記事本文を抽出する。
+    段落のテキスト量、句読点の数、リンク密度、class/idの語から要素をスコアリングし、
+    最も本文らしい要素の段落を返す。
+    """
+
+    @staticmethod
+    def _class_weight(tag) -> int:
+        weight = 0
+        for value in (" ".join(tag.get("class") or []), tag.get("id") or ""):
+            if not value:
+                continue
+            if NEGATIVE_PATTERN.search(value):
+                weight -= 25
+            if POSITIVE_PATTERN.search(value):
+                weight += 25
+        return weight
+
+    @staticmethod
+    def _link_density(tag, text_length: int) -> float:
+        if not text_length:
+            return 0.0
+        link_length = sum(len(a.get_text(strip=True)) for a in tag.find_all("a"))
+        return min(1.0, link_length / text_length)
+
+    @staticmethod
+    def _prepare(html: str) -> BeautifulSoup:
+        soup = BeautifulSoup(html, SOUP_PARSER)
+        for tag in soup.find_all(REMOVE_TAGS):
+            tag.decompose()
+        for tag in soup.find_all(True):
+            if tag.decomposed or tag.name in ("html", "body", "article", "main"):
+                continue
+            attrs = " ".join(tag.get("class") or []) + " " + (tag.get("id") or "")
+            if UNLIKELY_PATTERN.search(attrs) and not POSITIVE_PATTERN.search(attrs):
+                tag.decompose()
+        return soup
+
+    @staticmethod
+    def _paragraph_score(text: str) -> float:
+        commas = len(re.findall(r"[,、。]", text))
+        return 1 + commas + min(len(text) / 100, 3)
+
+    @staticmethod
+    def extract_text(html: str) -> str:
+        soup = MainContentExtractor._prepare(html)
+
+        scores = {}
+        nodes = {}
+        for paragraph in soup.find_all(PARAGRAPH_TAGS):
+            text = paragraph.get_text(" ", strip=True)
+            if len(text) < MIN_PARAGRAPH_LENGTH:
+                continue
+            score = MainContentExtractor._paragraph_score(text)
+            # 親には全体、祖父母には半分のスコアを加算する
+            for ancestor, share in (
+                (paragraph.parent, 1.0),
+                (paragraph.parent and paragraph.parent.parent, 0.5),
+            ):
+                if ancestor is None or ancestor.name is None:
+                    continue
+                key = id(ancestor)
+                if key not in scores:
+                    nodes[key] = ancestor
+                    scores[key] = TAG_WEIGHTS.get(
+                        ancestor.name, 0
+                    ) + MainContentExtractor._class_weight(ancestor)
+                scores[key] += score * share
+
+        if not scores:
+            paragraphs = [
+                p.get_text(" ", strip=True) for p in soup.find_all(PARAGRAPH_TAGS)
+            ]
+            return re.sub(r"\s+", " ", " ".join(p for p in paragraphs if p)).strip()
+
+        for key, node in nodes.items():
+            text_length = len(node.get_text(strip=True))
+            scores[key] *= 1 - MainContentExtractor._link_density(node, text_length)
+
+        best_key = max(scores, key=scores.get)
+        best = nodes[best_key]
+        threshold = max(10.0, scores[best_key] * 0.2)
+
+        # 本文が複数の兄弟要素に分かれている場合に備え、スコアの高い兄弟も含める
+        if best.parent is None:
+            blocks = [best]
+        else:
+            blocks = [
+                sibling
+                for sibling in best.parent.find_all(True, recursive=False)
+                if sibling is best or scores.get(id(sibling), 0) >= threshold
+            ]
+
+        texts = []
+        for block in blocks:
+            for paragraph in block.find_all(PARAGRAPH_TAGS):
+                text = paragraph.get_text(" ", strip=True)
+                density = MainContentExtractor._link_density(paragraph, len(text))
+                if text and density < 0.5:
+                    texts.append(text)
+        return re.sub(r"\s+", " ", " ".join(texts)).strip()
+
+    @staticmethod
+    def extract(html: str, title: str = "") -> Dict[str, str]:
+        """
+        ArticleCleaner.llm_clean_textと同じ形式で、本文とキーワードを返す。
+        """
+        clean_text = MainContentExtractor.extract_text(html) if html else ""
+        keyword = KeywordExtractor.dominant(title, clean_text)
+        return {"clean_text": clean_text, "keyword": keyword}
@@ -2,10 +2,12 @@ import uuid
 from datetime import datetime
 from firebase_admin import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.vector import Vector
 
 
 class News:
     COLLECTION = "news"
+    EMBEDDING_MODEL = "models/text-embedding-004"
 
     def __init__(
         self,
@@ -15,6 +17,7 @@ class News:
         language_code: str,
         published: datetime = None,
         id: str = None,
+        keyword_embedding: list = None,
     ):
         self.id = id if id else str(uuid.uuid4())
         self.content = content
@@ -22,6 +25,8 @@ class News:
         self.keyword = keyword
         self.language_code = language_code
         self.published = published if published else datetime.now()
+        # 作成済みのトピックとの重複判定に使う、キーワードのベクトル
+        self.keyword_embedding = keyword_embedding
 
     @staticmethod
     def from_dict(source):
@@ -32,6 +37,7 @@ class News:
             keyword=source.get("keyword", ""),
             language_code=source.get("language_code", ""),
             published=source.get("published", datetime.now()),
+            keyword_embedding=source.get("keyword_embedding"),
         )
 
     def to_dict(self):
@@ -42,6 +48,9 @@ class News:
             "keyword": self.keyword,
             "language_code": self.language_code,
             "published": self.published,
+            "keyword_embedding": (
+                Vector(list(self.keyword_embedding)) if self.keyword_embedding else None
+            ),
         }
 
     def save(self, ref):
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import json
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from openai import OpenAI
 from google.cloud.firestore_v1.base_query import FieldFilter
 from firebase_admin import firestore
@@ -12,17 +13,23 @@ from web_searcher import WebSearcher
 from article import Article
 from news import News
 from topic_extractor import TopicExtractor
+from query_embedding_cache import QueryEmbeddingCache
+from components import Components
+from agent.runtime import create_runtime
+from agent.tool_registry import ToolRegistry
 from agent.tools import (
     NEWS_GENERATION_TOOLS,
     vector_db_article_search,
-    get_article_title_url_list,
-    get_article_from_title_url,
+    get_articles_from_title_urls,
+    create_tool_registry,
 )
 from user import LANGUAGE_CODE
 
 GEMINI_MODEL = "gemini-1.5-flash"
 TOPIC_GEMINI_MODEL = "gemini-1.5-pro"
 OPENAI_MODEL = "gpt-4o-mini"
+# create_manyで共通の調査に使うウェブ検索結果の件数
+RESEARCH_WEB_RESULTS = 3
 
 RESPONSE_FORMAT = {
     "type": "json_schema",
@@ -58,22 +65,68 @@ class NewsGenerationAgent:
         db: firestore.Client,
         web_searcher: WebSearcher,
         model=OPENAI_MODEL,
+        llm_cleaning_fallback: bool = False,
+        runtime: str = None,
+        client: OpenAI = None,
+        content_fetcher: ArticleContentFetcher = None,
+        article_cleaner: ArticleCleaner = None,
+        summary_generator: ArticleSummaryGenerator = None,
+        embedding_cache: QueryEmbeddingCache = None,
+        topic_extractor: TopicExtractor = None,
     ):
-        self.client = OpenAI()
+        """
+        指定しなかったクライアントは、ウォームインスタンス内で共有するComponentsのものを使う。
+        """
+        self.client = client or Components.openai()
         self.db = db
         self.web_searcher = web_searcher
-        self.content_fetcher = ArticleContentFetcher()
-        self.article_cleaner = ArticleCleaner(GEMINI_MODEL)
-        self.summary_generator = ArticleSummaryGenerator(GEMINI_MODEL)
+        self.content_fetcher = content_fetcher or Components.content_fetcher()
+        self.article_cleaner = article_cleaner or Components.article_cleaner(GEMINI_MODEL)
+        self.summary_generator = summary_generator or Components.summary_generator(
+            GEMINI_MODEL
+        )
         self.article_collection = Article.collection(self.db)
-        self.news_collection = News.get_collection(self.db)
-        self.extractor = TopicExtractor(
-            model_name=TOPIC_GEMINI_MODEL,
-            db=db,
+        self.embedding_cache = embedding_cache or Components.query_embedding_cache(
+            self.db
+        )
+        # 本文を抽出できなかったページのみLLMで整形する（既定では無効）
+        self.llm_cleaning_fallback = llm_cleaning_fallback
+        self.tools = create_tool_registry(
+            NEWS_GENERATION_TOOLS,
+            db=self.db,
             article_collection=self.article_collection,
-            news_collection=self.news_collection,
+            web_searcher=self.web_searcher,
+            content_fetcher=self.content_fetcher,
+            article_cleaner=self.article_cleaner,
+            summary_generator=self.summary_generator,
+            embedding_cache=self.embedding_cache,
+            llm_fallback=self.llm_cleaning_fallback,
+        )
+        self.news_collection = News.get_collection(self.db)
+        self.extractor = topic_extractor or Components.topic_extractor(
+            TOPIC_GEMINI_MODEL, db=self.db
         )
         self.model = model
+        # 既定ではAssistants APIを使い、"chat"でChat Completionsのストリーミングを使う
+        self.runtime = create_runtime(
+            runtime,
+            client=self.client,
+            model=self.model,
+            instructions=INSTRUCTIONS,
+            assistant_id=OPENAI_ASSISTANTS_ID,
+            tools=self.tools,
+            response_format=RESPONSE_FORMAT,
+        )
+        # 調査済みの結果から各言語の原稿を書くだけなので、ツールは使わない
+        self.compose_runtime = create_runtime(
+            runtime,
+            client=self.client,
+            model=self.model,
+            instructions=INSTRUCTIONS,
+            assistant_id=OPENAI_ASSISTANTS_ID,
+            tools=ToolRegistry(),
+            response_format=RESPONSE_FORMAT,
+        )
 
     @staticmethod
     def create_assistant(client: OpenAI, model: str):
@@ -124,10 +177,60 @@ class NewsGenerationAgent:
 
         return result_strings
 
-    def prompt(self, language_code: str, topic: str) -> str:
-        related_article_str = vector_db_article_search(
-            self.article_collection, query=topic
+    def research(self, topic: str) -> str:
+        """
+        トピックについてデータベースとウェブを一度だけ調査し、関連する記事のテキストを返す。
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            related_future = executor.submit(
+                vector_db_article_search,
+                self.article_collection,
+                topic,
+                embedding_cache=self.embedding_cache,
+            )
+            web_future = executor.submit(
+                self.web_searcher.search, topic, num_results=RESEARCH_WEB_RESULTS
+            )
+            try:
+                related_article_str = related_future.result()
+            except Exception as e:
+                print(f"[ERROR] Failed to search related articles for '{topic}': {e}")
+                related_article_str = ""
+            try:
+                search_results = web_future.result()
+            except Exception as e:
+                print(f"[ERROR] Failed to search the web for '{topic}': {e}")
+                search_results = []
+
+        web_articles = get_articles_from_title_urls(
+            content_fetcher=self.content_fetcher,
+            article_cleaner=self.article_cleaner,
+            summary_generator=self.summary_generator,
+            article_collection=self.article_collection,
+            items=[{"title": r["title"], "url": r["url"]} for r in search_results],
+            llm_fallback=self.llm_cleaning_fallback,
+            db=self.db,
         )
+        # 取得や要約に失敗した記事はget_articles_from_title_urlsの結果に含まれない
+        return "\n".join(text for text in [related_article_str, *web_articles] if text)
+
+    def prompt(self, language_code: str, topic: str, research: str = None) -> str:
+        """
+        researchを渡すと、調査を指示せずにその内容を関連する記事として使う。
+        """
+        if research is None:
+            related_article_str = vector_db_article_search(
+                self.article_collection,
+                query=topic,
+                embedding_cache=self.embedding_cache,
+            )
+            task_lines = [
+                "下記のトピックに関する技術情報をデータベースとウェブを用いて調査してください。",
+                "その調査結果を使用して質問に回答してください。",
+            ]
+        else:
+            related_article_str = research
+            task_lines = ["下記の関連する記事を使用して、トピックに関する質問に回答してください。"]
 
         language_instructions = (
             "- 質問の回答は、300文字以内で作成すること\n- アルファベット表記の固有名詞は日本における一般的な読みに変換すること\n  - 例: `ChatGPT` => `チャットジーピーティー`"
@@ -137,8 +240,7 @@ class NewsGenerationAgent:
 
         prompt_lines = [
             "あなたはエンジニアに最新の技術情報を伝えるアナウンサーです。",
-            "下記のトピックに関する技術情報をデータベースとウェブを用いて調査してください。",
-            "その調査結果を使用して質問に回答してください。",
+            *task_lines,
             "",
             f"トピック: {topic}",
             "質問: ニュースを教えてください",
@@ -163,85 +265,20 @@ class NewsGenerationAgent:
     def extract_topic(self) -> str:
         return self.extractor.extract_topic()
 
-    def create(self, language_code: str, topic: str) -> News:
-        prompt = self.prompt(language_code=language_code, topic=topic)
-
-        thread = self.client.beta.threads.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ]
-        )
-
-        run = self.client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=OPENAI_ASSISTANTS_ID,
-            response_format=RESPONSE_FORMAT,
-            tools=NEWS_GENERATION_TOOLS,
-        )
-
-        # ツール呼び出しが必要な場合、その処理を実施
-        while run.status == "requires_action":
-            tool_outputs = []
-            for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                function_name = tool_call.function.name
-                arguments = json.loads(tool_call.function.arguments)
-                if function_name == "vector_db_article_search":
-                    output = vector_db_article_search(
-                        article_collection=self.article_collection,
-                        query=arguments["query"],
-                    )
-                elif function_name == "get_article_title_url_list":
-                    output = get_article_title_url_list(
-                        web_searcher=self.web_searcher,
-                        query=arguments["query"],
-                    )
-                elif function_name == "get_article_from_title_url":
-                    output = get_article_from_title_url(
-                        content_fetcher=self.content_fetcher,
-                        article_cleaner=self.article_cleaner,
-                        summary_generator=self.summary_generator,
-                        article_collection=self.article_collection,
-                        title=arguments["title"],
-                        url=arguments["url"],
-                    )
-                else:
-                    output = "[Unknown tool call]"
-                tool_outputs.append(
-                    {
-                        "tool_call_id": tool_call.id,
-                        "output": json.dumps(output, ensure_ascii=False),
-                    }
-                )
-
-            # ツールの出力を送信して再度ポーリング
-            run = self.client.beta.threads.runs.submit_tool_outputs_and_poll(
-                thread_id=thread.id,
-                run_id=run.id,
-                tool_outputs=tool_outputs,
-            )
-
-        # 最終メッセージから生成結果を取得
-        if run.status == "completed":
-            messages = self.client.beta.threads.messages.list(thread_id=thread.id)
-            assistant_messages = [m for m in messages.data if m.role == "assistant"]
-
-            if assistant_messages:
-                final_msg = assistant_messages[-1]
-                json_text = next(
-                    (c.text.value for c in final_msg.content if c.type == "text"), None
-                )
-                if json_text:
-                    parsed_result = json.loads(json_text)
-                    news_content = parsed_result["news_content"]
-                    sample_question = parsed_result["sample_question"]
-                    keyword = topic
-                else:
-                    raise ValueError("Response does not contain valid JSON text.")
+    def create(self, language_code: str, topic: str, research: str = None) -> News:
+        """
+        researchを渡すと、その調査結果からツールを使わずにニュースを作成する。
+        """
+        prompt = self.prompt(language_code=language_code, topic=topic, research=research)
+        runtime = self.runtime if research is None else self.compose_runtime
+        json_text = runtime.run(prompt)
+        if not json_text:
+            raise ValueError("Response does not contain valid JSON text.")
 
-        self.client.beta.threads.delete(thread.id)
+        parsed_result = json.loads(json_text)
+        news_content = parsed_result["news_content"]
+        sample_question = parsed_result["sample_question"]
+        keyword = topic
 
         if not news_content or not sample_question or not keyword:
             print(
@@ -249,12 +286,48 @@ class NewsGenerationAgent:
             )
             return
 
+        # 各言語のニュースは同じキーワードなので、2件目以降はキャッシュのベクトルを使う
+        try:
+            keyword_embedding = self.embedding_cache.embed(
+                keyword, model=News.EMBEDDING_MODEL
+            )
+        except Exception as e:
+            print(f"[ERROR] Failed to embed news keyword '{keyword}': {e}")
+            keyword_embedding = None
+
         news_obj = News(
             content=news_content,
             sample_question=sample_question,
             keyword=keyword,
             language_code=language_code,
+            keyword_embedding=keyword_embedding,
         )
         news_obj.save(self.news_collection)
 
         return news_obj
+
+    def create_many(self, language_codes: List[str], topic: str) -> Dict[str, News]:
+        """
+        トピックの調査を一度だけ行い、その結果から複数言語のニュースを並列に作成する。
+        作成できた言語のニュースを言語コードごとに返す。
+        """
+        if not language_codes:
+            return {}
+        research = self.research(topic)
+        news_by_language = {}
+        with ThreadPoolExecutor(max_workers=len(language_codes)) as executor:
+            futures = {
+                language_code: executor.submit(
+                    self.create, language_code, topic, research
+                )
+                for language_code in language_codes
+            }
+            for language_code, future in futures.items():
+                try:
+                    news = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Failed to create news - {language_code}: {e}")
+                    continue
+                if news:
+                    news_by_language[language_code] = news
+        return news_by_language
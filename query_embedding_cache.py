@@ -0,0 +1,133 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List
+import google.generativeai as genai
+from firebase_admin import firestore
+
+
+class QueryEmbeddingCache:
+    """
+    検索クエリのベクトルをキャッシュする。
+    プロセス内のLRU（TTL付き）と、任意でFirestoreの永続キャッシュの2段で構成する。
+    """
+
+    COLLECTION = "query_embeddings"
+    MAX_SIZE = 512
+    TTL = 24 * 60 * 60  # プロセス内キャッシュの有効期間（秒）
+    PERSISTENT_TTL = timedelta(days=30)
+
+    def __init__(self, max_size: int = MAX_SIZE, ttl: float = TTL, collection=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.collection = collection
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_collection(db: firestore.Client):
+        return db.collection(QueryEmbeddingCache.COLLECTION)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        query = unicodedata.normalize("NFKC", query).lower()
+        return re.sub(r"\s+", " ", query).strip()
+
+    @staticmethod
+    def key(query: str, model: str) -> str:
+        normalized = QueryEmbeddingCache.normalize(query)
+        return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _get_local(self, key: str) -> List[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            embedding, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    def _set_local(self, key: str, embedding: List[float]):
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _get_persistent(self, key: str) -> List[float]:
+        if self.collection is None:
+            return None
+        try:
+            doc = self.collection.document(key).get()
+        except Exception as e:
+            print(f"[ERROR] Failed to read query embedding cache: {e}")
+            return None
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        created = data.get("created")
+        if created and created < datetime.now(timezone.utc) - self.PERSISTENT_TTL:
+            return None
+        return list(data.get("embedding") or []) or None
+
+    def _set_persistent(self, key: str, query: str, model: str, embedding: List[float]):
+        if self.collection is None:
+            return
+        try:
+            self.collection.document(key).set(
+                {
+                    "query": self.normalize(query),
+                    "model": model,
+                    "embedding": embedding,
+                    "created": datetime.now(timezone.utc),
+                }
+            )
+        except Exception as e:
+            print(f"[ERROR] Failed to write query embedding cache: {e}")
+
+    def embed(self, query: str, model: str) -> List[float]:
+        """
+        クエリのベクトルを返す。キャッシュになければembedding APIを呼び出して保存する。
+        """
+        key = self.key(query, model)
+
+        embedding = self._get_local(key)
+        if embedding is not None:
+            self._count("hits")
+            return embedding
+
+        embedding = self._get_persistent(key)
+        if embedding is not None:
+            self._count("persistent_hits")
+            self._set_local(key, embedding)
+            return embedding
+
+        self._count("misses")
+        embedding = genai.embed_content(model=model, content=query)["embedding"]
+        self._set_local(key, embedding)
+        self._set_persistent(key, query, model, embedding)
+        return embedding
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
@@ -1,25 +1,54 @@
 from typing import List
+import requests
 import feedparser
 from article import Article
 from article_cleaner import ArticleCleaner
+from feed_state import FeedState
 
 
 class RSSArticleFetcher:
     FEED_ENTRIES_LIMIT = 10
+    FEED_TIMEOUT = 15
+    HEADERS = {"User-Agent": "trend-curator/1.0 (+https://github.com/yutoo89/tech-curator)"}
 
     def __init__(self, model_name: str):
         self.cleaner = ArticleCleaner(model_name)
 
-    def fetch_articles(self, rss_url: str, source: str = None) -> List[Article]:
+    def fetch_articles(
+        self,
+        rss_url: str,
+        source: str = None,
+        timeout: float = FEED_TIMEOUT,
+        state: FeedState = None,
+    ) -> List[Article]:
+        """
+        stateを渡すと条件付きGETを行い、更新がなければ空のリストを返す。
+        取得済みのエントリはスキップし、stateを今回の取得結果で更新する。
+        通信やパースに失敗した場合は、呼び出し元でフィードごとに記録できるよう例外を送出する。
+        """
         articles = []
 
-        try:
-            feed = feedparser.parse(rss_url)
-        except Exception as e:
-            print(f"[ERROR] Failed to parse URL '{rss_url}': {e}")
+        # feedparserは通信のタイムアウトを指定できないため、取得はrequestsで行う
+        # ETag/Last-Modifiedもfeedparserのetag/modifiedと同じく条件付きGETのヘッダとして送る
+        headers = dict(self.HEADERS)
+        if state:
+            headers.update(state.request_headers())
+        response = requests.get(rss_url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            print(f"[INFO] Feed '{rss_url}' not modified. Skipping parse.")
             return []
+        response.raise_for_status()
+        feed = feedparser.parse(
+            response.content, response_headers=dict(response.headers)
+        )
+        if feed.bozo and not feed.entries:
+            raise ValueError(f"Failed to parse feed: {feed.bozo_exception}")
 
-        for entry in feed.entries[: self.FEED_ENTRIES_LIMIT]:
+        entries = feed.entries[: self.FEED_ENTRIES_LIMIT]
+        seen_entry_ids = set(state.seen_entry_ids) if state else set()
+        for entry in entries:
+            if self.entry_id(entry) in seen_entry_ids:
+                continue
             title = entry.title
             summary = self.cleaner.clean_text(entry.summary)
             article = Article(
@@ -27,8 +56,20 @@ class RSSArticleFetcher:
                 title=title,
                 summary=summary,
                 url=entry.link,
-                published=entry.published,
+                # 公開日時による絞り込みができるよう、文字列ではなくdatetimeで保存する
+                published=Article.published_datetime(
+                    entry.get("published") or entry.get("updated")
+                ),
             )
             articles.append(article)
 
+        if state:
+            state.etag = response.headers.get("ETag")
+            state.modified = response.headers.get("Last-Modified")
+            state.seen_entry_ids = [self.entry_id(entry) for entry in entries]
+
         return articles
+
+    @staticmethod
+    def entry_id(entry) -> str:
+        return entry.get("id") or entry.get("link", "")
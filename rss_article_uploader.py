@@ -1,75 +1,180 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from rss_article_fetcher import RSSArticleFetcher
 from article import Article
+from article_signature_index import ArticleSignatureIndex
+from feed_state import FeedState
+from rss_feeds import RSS_FEEDS
 from firebase_admin import firestore
 
 
 class RssArticleUploader:
     BUCKET_NAME = "trend-curator-articles"
-    RSS_FEEDS = {
-        "Hacker News Latest": "https://hnrss.org/newest",
-        "TechCrunch Feed": "https://techcrunch.com/feed/",
-        "Dev.to Articles": "https://dev.to/feed",
-        "Smashing Magazine Feed": "https://www.smashingmagazine.com/feed/",
-        "Stack Overflow Blog Feed": "https://stackoverflow.blog/feed/",
-        "Qiita Popular Articles": "https://qiita.com/popular-items/feed.atom",
-        "CodeZine Latest Articles": "https://codezine.jp/rss/new/20/index.xml",
-    }
+    RSS_FEEDS = RSS_FEEDS
+    FETCH_CONCURRENCY = 8
 
     def __init__(self, model_name: str, db: firestore.Client):
         self.fetcher = RSSArticleFetcher(model_name)
+        self.db = db
         self.article_collection = Article.collection(db)
+        self.feed_report = []
+        self.feed_states = {}
 
-    def bulk_upload(self):
-        articles_by_source = {}
+    def _fetch_source(self, source: str, rss_url: str) -> dict:
+        started = time.perf_counter()
+        articles = None
+        error = None
+        try:
+            articles = self.fetcher.fetch_articles(
+                rss_url,
+                source,
+                timeout=RSSArticleFetcher.FEED_TIMEOUT,
+                state=self.feed_states.get(rss_url),
+            )
+        except Exception as e:
+            error = str(e)
+        return {
+            "source": source,
+            "articles": articles,
+            "error": error,
+            "elapsed": time.perf_counter() - started,
+        }
 
-        for source, rss_url in self.RSS_FEEDS.items():
-            try:
-                articles_by_source[source] = self.fetcher.fetch_articles(
-                    rss_url, source
+    def fetch_all(self) -> Dict[str, List[Article]]:
+        """
+        全てのRSSフィードを並列に取得し、ソースごとの記事リストを返す。
+        各フィードの所要時間はfeed_reportに記録する。
+        """
+        try:
+            self.feed_states = FeedState.get_all(self.db, list(self.RSS_FEEDS.values()))
+        except Exception as e:
+            print(f"[ERROR] Failed to load feed states: {e}")
+            self.feed_states = {}
+
+        max_workers = max(1, min(self.FETCH_CONCURRENCY, len(self.RSS_FEEDS)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._fetch_source, source, rss_url)
+                for source, rss_url in self.RSS_FEEDS.items()
+            ]
+            # RSS_FEEDSの定義順を保つため、完了順ではなく投入順に結果を集める
+            results = [future.result() for future in futures]
+
+        self.feed_report = []
+        articles_by_source = {}
+        for result in results:
+            source = result["source"]
+            self.feed_report.append(
+                {
+                    "source": source,
+                    "count": len(result["articles"] or []),
+                    "elapsed": result["elapsed"],
+                    "error": result["error"],
+                }
+            )
+            if result["error"] is not None:
+                print(
+                    f"[ERROR] Failed to fetch articles for source '{source}': {result['error']}"
                 )
-            except Exception as e:
-                print(f"[ERROR] Failed to fetch articles for source '{source}': {e}")
                 continue
+            articles_by_source[source] = result["articles"]
 
-        sources = list(articles_by_source.keys())
-        source_article_queues = {
-            source: iter(articles) for source, articles in articles_by_source.items()
-        }
+        for report in self.feed_report:
+            print(
+                f"[INFO] Feed '{report['source']}': {report['count']} articles in {report['elapsed']:.2f}s"
+            )
+        return articles_by_source
 
-        total_uploaded = 0
+    @staticmethod
+    def _interleave(articles_by_source: Dict[str, List[Article]]) -> List[Article]:
         # 同じサイトに連続でアクセスするとスクレイピングが失敗するため順番を入れ替える
-        while True:
-            articles_uploaded = False
-            for source in sources:
-                try:
-                    article = next(source_article_queues[source])
-
-                    try:
-                        doc_id = article.id
-                        if Article.exists(self.article_collection, doc_id):
-                            print(
-                                f"[INFO] Article '{article.title}' already exists. Skipping upload."
-                            )
-                            continue
-                        article.save(self.article_collection)
-                        total_uploaded += 1
-                        articles_uploaded = True
-                    except Exception as e:
-                        print(
-                            f"[ERROR] Failed to process article '{article.url}' from source '{article.source}': {e}"
-                        )
-                        continue
-
-                except StopIteration:
-                    # This source has no more articles
-                    continue
-
-            if not articles_uploaded:
-                # Exit the loop if no articles were uploaded in this round
-                break
+        queues = [list(articles) for articles in articles_by_source.values()]
+        ordered = []
+        for index in range(max((len(q) for q in queues), default=0)):
+            for queue in queues:
+                if index < len(queue):
+                    ordered.append(queue[index])
+        return ordered
+
+    def _link_duplicates(self, articles: List[Article]):
+        """
+        別のURLで配信された同じ記事を除き、保存する記事と {保存済みの正規の記事ID: 重複する記事のURLのリスト} を返す。
+        同じ実行で取得した記事どうしの重複は、保存前の正規の記事のduplicate_urlsに追加する。
+        """
+        try:
+            duplicates = ArticleSignatureIndex.find_duplicates(self.db, articles)
+        except Exception as e:
+            print(f"[ERROR] Failed to check duplicate articles: {e}")
+            return articles, {}
+
+        by_id = {article.id: article for article in articles}
+        unique = []
+        links = {}
+        for article in articles:
+            canonical_id = duplicates.get(article.id)
+            if canonical_id is None:
+                unique.append(article)
+                continue
+            print(
+                f"[INFO] Article '{article.title}' is a duplicate of '{canonical_id}'. Skipping upload."
+            )
+            if canonical_id in by_id:
+                by_id[canonical_id].duplicate_urls.append(article.url)
+            else:
+                links.setdefault(canonical_id, []).append(article.url)
+        return unique, links
+
+    def bulk_upload(self):
+        articles_by_source = self.fetch_all()
+
+        candidates = []
+        seen_ids = set()
+        for article in self._interleave(articles_by_source):
+            if article.id in seen_ids:
+                continue
+            seen_ids.add(article.id)
+            candidates.append(article)
+
+        try:
+            existing_ids = Article.existing_ids(
+                self.db, self.article_collection, [a.id for a in candidates]
+            )
+        except Exception as e:
+            print(f"[ERROR] Failed to check existing articles: {e}")
+            return
+
+        new_articles = []
+        for article in candidates:
+            if article.id in existing_ids:
+                print(f"[INFO] Article '{article.title}' already exists. Skipping upload.")
+                continue
+            new_articles.append(article)
+
+        new_articles, links = self._link_duplicates(new_articles)
 
+        total_uploaded = Article.bulk_save(
+            self.db, self.article_collection, new_articles
+        )
         print(f"Total articles uploaded: {total_uploaded}")
 
+        # 保存していない記事を正規の記事として登録しないよう、全件保存できた場合のみ署名を記録する
+        if total_uploaded == len(new_articles):
+            try:
+                ArticleSignatureIndex.bulk_add(self.db, new_articles)
+            except Exception as e:
+                print(f"[ERROR] Failed to save article signatures: {e}")
+        if links:
+            linked = Article.link_duplicates(self.db, self.article_collection, links)
+            print(f"[INFO] Linked duplicates to {linked} existing articles")
+
+        # 保存に失敗した記事を次回も取得できるよう、全件保存できた場合のみ既読状態を記録する
+        if total_uploaded == len(new_articles) and self.feed_states:
+            try:
+                FeedState.bulk_save(self.db, list(self.feed_states.values()))
+            except Exception as e:
+                print(f"[ERROR] Failed to save feed states: {e}")
+
 
 # import os
 # import firebase_admin
@@ -0,0 +1,10 @@
+# 記事を収集するRSSフィード。キーは記事のsourceとして保存し、検索の絞り込みにも使う
+RSS_FEEDS = {
+    "Hacker News Latest": "https://hnrss.org/newest",
+    "TechCrunch Feed": "https://techcrunch.com/feed/",
+    "Dev.to Articles": "https://dev.to/feed",
+    "Smashing Magazine Feed": "https://www.smashingmagazine.com/feed/",
+    "Stack Overflow Blog Feed": "https://stackoverflow.blog/feed/",
+    "Qiita Popular Articles": "https://qiita.com/popular-items/feed.atom",
+    "CodeZine Latest Articles": "https://codezine.jp/rss/new/20/index.xml",
+}
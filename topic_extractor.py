@@ -6,6 +6,22 @@ import google.generativeai as genai
 from firebase_admin import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 
+from topic_memory import TopicMemory
+from trend_scorer import KeywordMatcher, TrendCandidate, TrendScorer
+
+# 候補が絞り込めた場合は、その中から選ぶだけなので軽量なモデルを使う
+CANDIDATE_GEMINI_MODEL = "gemini-1.5-flash"
+# LLMに渡す候補の数
+TOP_CANDIDATES = 10
+RECENT_DAYS = 3
+RECENT_ARTICLES = 100
+# バースト性の基準にする、直近の期間より前の記事
+BASELINE_DAYS = 14
+BASELINE_ARTICLES = 500
+# 候補を抽出できなかった場合にLLMに渡す記事タイトルの期間と件数
+PROMPT_DAYS = 14
+PROMPT_ARTICLES = 50
+
 TOPIC_SCHEMA = {
     "type": "object",
     "properties": {"topic": {"type": "string"}},
@@ -15,36 +31,29 @@ TOPIC_SCHEMA = {
 
 class TopicExtractor:
     def __init__(
-        self, model_name: str, db: firestore.Client, article_collection, news_collection
+        self,
+        model_name: str,
+        db: firestore.Client,
+        article_collection,
+        news_collection,
+        candidate_model_name: str = CANDIDATE_GEMINI_MODEL,
     ):
         self.model = genai.GenerativeModel(model_name)
+        self.candidate_model = genai.GenerativeModel(candidate_model_name)
         self.db = db
         self.article_collection = article_collection
         self.news_collection = news_collection
 
-    def _fetch_keywords_of_past_week(self) -> List[str]:
-        one_week_ago = datetime.now() - timedelta(days=3)
-        query = self.news_collection.where(
-            filter=FieldFilter("published", ">=", one_week_ago)
-        )
-        docs = query.get()
-
-        keywords = []
-        for doc in docs:
-            data = doc.to_dict()
-            kw = data.get("keyword")
-            if kw:
-                keywords.append(kw.strip())
-        return keywords
-
     def _get_recent_articles(self) -> List[Dict[str, str]]:
-        cutoff_date = datetime.now() - timedelta(days=14)
+        cutoff_date = datetime.now() - timedelta(days=RECENT_DAYS)
         query = self.article_collection.where(
             filter=FieldFilter("published", ">=", cutoff_date)
         )
+        # embeddingなどの不要なフィールドは取得しない
         docs = (
-            query.order_by("published", direction=firestore.Query.DESCENDING)
-            .limit(50)
+            query.select(["title", "body", "keyword"])
+            .order_by("published", direction=firestore.Query.DESCENDING)
+            .limit(RECENT_ARTICLES)
             .stream()
         )
 
@@ -53,26 +62,56 @@ class TopicExtractor:
             article_dict = doc.to_dict()
             title = article_dict.get("title", "")
             body = article_dict.get("body", "")
-            articles.append({"title": title, "body": body})
+            keyword = article_dict.get("keyword", "")
+            articles.append({"title": title, "body": body, "keyword": keyword})
         return articles
 
+    def _get_prompt_articles(self) -> List[Dict[str, str]]:
+        """
+        候補を抽出できなかった場合にLLMに渡す、直近PROMPT_DAYS日の記事のタイトルを返す。
+        """
+        cutoff_date = datetime.now() - timedelta(days=PROMPT_DAYS)
+        query = self.article_collection.where(
+            filter=FieldFilter("published", ">=", cutoff_date)
+        )
+        docs = (
+            query.select(["title"])
+            .order_by("published", direction=firestore.Query.DESCENDING)
+            .limit(PROMPT_ARTICLES)
+            .stream()
+        )
+        return [doc.to_dict() for doc in docs]
+
+    def _get_baseline_articles(self) -> List[Dict[str, str]]:
+        """
+        直近の期間より前の記事のタイトルとキーワードを返す。
+        """
+        now = datetime.now()
+        query = self.article_collection.where(
+            filter=FieldFilter("published", ">=", now - timedelta(days=BASELINE_DAYS))
+        ).where(filter=FieldFilter("published", "<", now - timedelta(days=RECENT_DAYS)))
+        docs = (
+            query.select(["title", "keyword"])
+            .order_by("published", direction=firestore.Query.DESCENDING)
+            .limit(BASELINE_ARTICLES)
+            .stream()
+        )
+        return [doc.to_dict() for doc in docs]
+
     def create_prompt(
         self,
         article_list: List[Dict[str, str]],
         exclude_topic_list: List[str],
     ) -> str:
         # 除外キーワードに一致する記事を除外し、所定の文字列形式に変換
+        matcher = KeywordMatcher(exclude_topic_list)
         filtered_articles = []
         for article in article_list:
             title = article.get("title", "")
-            body = article.get("body", "")
-            should_exclude = False
-            for excl in exclude_topic_list:
-                if excl and excl in title:
-                    should_exclude = True
-                    break
-            if not should_exclude:
+            if not matcher.matches(title):
                 filtered_articles.append(title)
+            if len(filtered_articles) >= PROMPT_ARTICLES:
+                break
 
         # 除外キーワード一覧を分かりやすく結合
         joined_excludes = (
@@ -93,15 +132,36 @@ class TopicExtractor:
         ]
         return "\n".join(prompt_lines)
 
-    def extract_topic(
+    def create_candidate_prompt(
         self,
-    ) -> dict:
-        exclude_topic_list = self._fetch_keywords_of_past_week()
-        article_list = self._get_recent_articles()
+        candidates: List[TrendCandidate],
+        exclude_topic_list: List[str],
+    ) -> str:
+        joined_excludes = (
+            ", ".join(exclude_topic_list) if exclude_topic_list else "なし"
+        )
+        candidate_lines = []
+        for candidate in candidates:
+            candidate_lines.append(
+                f"- {candidate.term}（{candidate.count}件）: {' / '.join(candidate.titles)}"
+            )
 
-        prompt = self.create_prompt(article_list, exclude_topic_list)
+        prompt_lines = [
+            "以下の条件で、直近の記事で話題になっているトピックの候補から、最も重要なトピックをひとつだけ選んでください。",
+            "- 候補は話題になっている順に並んでおり、各候補には出現した記事数と記事タイトルの例を付している",
+            "- 除外キーワードに重複・類似するトピックは絶対に選ばないこと",
+            "- トピックは抽象的な概念ではなく、具体的なツール名やサービス名などの固有名詞とすること",
+            "- 候補の表記が不完全な場合は、記事タイトルに基づいて正式な名前に補ってよい",
+            "",
+            f"除外キーワード: '{joined_excludes}'",
+            "",
+            "候補一覧:",
+            "\n".join(candidate_lines),
+        ]
+        return "\n".join(prompt_lines)
 
-        response = self.model.generate_content(
+    def _generate_topic(self, model: genai.GenerativeModel, prompt: str) -> str:
+        response = model.generate_content(
             prompt,
             generation_config=genai.GenerationConfig(
                 response_mime_type="application/json",
@@ -118,3 +178,52 @@ class TopicExtractor:
             print("LLMの応答に 'topic' キーが含まれていません。")
             raise KeyError("LLMの応答に 'topic' キーが含まれていません。")
         return result["topic"]
+
+    def extract_topic(
+        self,
+    ) -> str:
+        """
+        直近の記事から話題の候補をローカルでスコアリングし、1位が明らかに優勢であればLLMを使わずに選ぶ。
+        そうでなければ上位の候補を軽量なモデルに渡して選ばせ、候補がなければ記事タイトルから選ばせる。
+        直近に作成したニュースのキーワードと意味的に重複するトピックは選ばない。
+        """
+        memory = TopicMemory.load(self.db, self.news_collection)
+        exclude_topic_list = memory.keywords
+        article_list = self._get_recent_articles()
+
+        candidates = TrendScorer.rank(
+            article_list,
+            self._get_baseline_articles(),
+            KeywordMatcher(exclude_topic_list),
+        )[:TOP_CANDIDATES]
+        duplicates = memory.duplicates([candidate.term for candidate in candidates])
+        for term, (keyword, similarity) in duplicates.items():
+            print(
+                f"[INFO] Skipped topic similar to '{keyword}': {term} "
+                f"(similarity: {similarity:.2f})"
+            )
+        candidates = [c for c in candidates if c.term not in duplicates]
+
+        winner = TrendScorer.winner(candidates)
+        if winner:
+            print(
+                f"[INFO] Selected topic without LLM: {winner.term} "
+                f"(articles: {winner.count}, score: {winner.score:.1f})"
+            )
+            return winner.term
+
+        if candidates:
+            prompt = self.create_candidate_prompt(candidates, exclude_topic_list)
+            topic = self._generate_topic(self.candidate_model, prompt)
+        else:
+            # スコアリングより長い期間の記事タイトルから選ばせる
+            prompt = self.create_prompt(self._get_prompt_articles(), exclude_topic_list)
+            topic = self._generate_topic(self.model, prompt)
+
+        if not memory.is_duplicate(topic):
+            return topic
+        if not candidates:
+            raise ValueError(f"Topic was already covered recently: {topic}")
+        # 候補は重複を除いてあるため、LLMが重複するトピックを返した場合は1位の候補を使う
+        print(f"[INFO] Topic was already covered recently: {topic}")
+        return candidates[0].term
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import google.generativeai as genai
+import numpy as np
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.vector import Vector
+
+from article import Article
+from news import News
+
+
+class TopicMemory:
+    """
+    直近に作成したニュースのキーワードとそのベクトルを保持し、意味的に重複するトピックを判定する。
+    'DeepSeek-R1' と 'DeepSeek R1' のような表記揺れも、ベクトルのコサイン類似度で同じトピックとみなす。
+    過去のキーワードのベクトルはnewsドキュメントのkeyword_embeddingに保存したものを使う。
+    """
+
+    DAYS = 3
+    SIMILARITY_THRESHOLD = 0.9
+
+    def __init__(self, keywords: List[str], embeddings: Dict[str, List[float]]):
+        """
+        keywordsは直近のキーワードのすべて、embeddingsはそのうちベクトルがあるもの。
+        """
+        self.keywords = keywords
+        self.embedded_keywords = list(embeddings)
+        matrix = np.asarray(list(embeddings.values()), dtype=np.float32)
+        self.matrix = TopicMemory._normalize(
+            matrix.reshape(len(embeddings), -1 if embeddings else 0)
+        )
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def embed(texts: List[str]) -> List[List[float]]:
+        """
+        複数のテキストを1回のembedding APIの呼び出しでベクトル化する。
+        """
+        if not texts:
+            return []
+        response = genai.embed_content(model=News.EMBEDDING_MODEL, content=texts)
+        return response["embedding"]
+
+    @staticmethod
+    def load(db: firestore.Client, news_collection, days: int = DAYS) -> "TopicMemory":
+        """
+        直近days日に作成したニュースのキーワードとベクトルを読み込む。
+        ベクトルが保存されていないニュースはここでベクトル化し、バッチ書き込みでドキュメントに保存する。
+        """
+        cutoff = datetime.now() - timedelta(days=days)
+        docs = (
+            news_collection.where(filter=FieldFilter("published", ">=", cutoff))
+            .select(["keyword", "keyword_embedding"])
+            .stream()
+        )
+
+        keywords = []
+        embeddings: Dict[str, List[float]] = {}
+        missing = {}
+        for doc in docs:
+            data = doc.to_dict()
+            keyword = (data.get("keyword") or "").strip()
+            if not keyword:
+                continue
+            if keyword not in keywords:
+                keywords.append(keyword)
+            embedding = data.get("keyword_embedding")
+            if embedding:
+                embeddings.setdefault(keyword, list(embedding))
+            else:
+                missing.setdefault(keyword, []).append(doc.reference)
+
+        unembedded = [keyword for keyword in missing if keyword not in embeddings]
+        if unembedded:
+            try:
+                for keyword, embedding in zip(unembedded, TopicMemory.embed(unembedded)):
+                    embeddings[keyword] = embedding
+            except Exception as e:
+                print(f"[ERROR] Failed to embed news keywords: {e}")
+        updates = [
+            (ref, embeddings[keyword])
+            for keyword, refs in missing.items()
+            if keyword in embeddings
+            for ref in refs
+        ]
+        for start in range(0, len(updates), Article.WRITE_BATCH_LIMIT):
+            batch = db.batch()
+            for ref, embedding in updates[start : start + Article.WRITE_BATCH_LIMIT]:
+                batch.update(ref, {"keyword_embedding": Vector(embedding)})
+            batch.commit()
+
+        return TopicMemory(keywords, embeddings)
+
+    def duplicates(self, topics: List[str]) -> Dict[str, Tuple[str, float]]:
+        """
+        過去のキーワードとの類似度が閾値以上のトピックについて、最も類似するキーワードと類似度を返す。
+        """
+        if not self.embedded_keywords or not topics:
+            return {}
+        try:
+            vectors = TopicMemory._normalize(
+                np.asarray(TopicMemory.embed(topics), dtype=np.float32)
+            )
+        except Exception as e:
+            print(f"[ERROR] Failed to embed topics: {e}")
+            return {}
+
+        similarities = vectors @ self.matrix.T
+        best = similarities.argmax(axis=1)
+        result = {}
+        for i, topic in enumerate(topics):
+            similarity = float(similarities[i, best[i]])
+            if similarity >= self.SIMILARITY_THRESHOLD:
+                result[topic] = (self.embedded_keywords[best[i]], similarity)
+        return result
+
+    def is_duplicate(self, topic: str) -> bool:
+        return topic in self.duplicates([topic])
@@ -0,0 +1,233 @@
+import math
+from collections import Counter, deque, namedtuple
+from typing import Dict, Iterable, List, Set
+
+from keyword_extractor import KeywordExtractor, STOPWORDS
+
+# term: 表記, score: トレンドスコア, count: 出現した記事数, burst: ベースラインに対する出現率の比
+TrendCandidate = namedtuple("TrendCandidate", "term score count burst titles")
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+class KeywordMatcher:
+    """
+    複数のキーワードのいずれかがテキストに含まれるかを、Aho–Corasick法でテキストの1回の走査で判定する。
+    大文字・小文字や空白・ハイフンの違いは無視し、英数字のキーワードは単語の途中には一致させない。
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Set[str] = {
+            KeywordExtractor.normalize(keyword) for keyword in keywords if keyword
+        }
+        self.keywords.discard("")
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for keyword in self.keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(keyword)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def find(self, text: str) -> Set[str]:
+        """
+        テキストに含まれるキーワードを返す。
+        """
+        found = set()
+        if not self.keywords or not text:
+            return found
+        text = KeywordExtractor.normalize(text)
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword in self._output[state]:
+                start = end - len(keyword)
+                if _is_word_char(keyword[0]) and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if _is_word_char(keyword[-1]) and end < len(text) and _is_word_char(text[end]):
+                    continue
+                found.add(keyword)
+        return found
+
+    def matches(self, text: str) -> bool:
+        return bool(self.find(text))
+
+
+class TrendScorer:
+    """
+    直近の記事から固有名詞とそのn-gramを候補として抽出し、ベースライン期間の記事と比べた出現率の伸び（バースト性）でスコアを付ける。
+    """
+
+    MAX_NGRAM = 3
+    BODY_CHARS = 1000
+    # 本文にのみ出現した記事は、タイトルやキーワードに出現した記事より低く数える
+    BODY_WEIGHT = 0.5
+    # 'DeepSeek R1' のような複数語の名前は単語単体より具体的なので加点する
+    MULTI_WORD_BONUS = 1.2
+    MIN_ARTICLES = 2
+    MAX_TITLES = 3
+    # 1位の候補がこの記事数以上に出現し、2位のスコアのこの倍率以上であればLLMを使わずに選ぶ
+    WINNER_MIN_ARTICLES = 3
+    WINNER_RATIO = 2.0
+
+    @staticmethod
+    def terms(text: str) -> List[str]:
+        """
+        テキストの固有名詞の候補と、複数語の候補に含まれる語のn-gramを返す。
+        """
+        terms = []
+        for candidate in KeywordExtractor.candidates(text):
+            words = candidate.split()
+            terms.append(candidate)
+            if len(words) == 1:
+                continue
+            for n in range(1, min(len(words), TrendScorer.MAX_NGRAM + 1)):
+                for i in range(len(words) - n + 1):
+                    term = " ".join(words[i : i + n]).strip(".-+#")
+                    if len(term) >= 2 and term.lower() not in STOPWORDS:
+                        terms.append(term)
+        return terms
+
+    @staticmethod
+    def _article_terms(article: Dict[str, str], include_body: bool) -> Dict[str, float]:
+        """
+        記事に出現する候補の正規化した表記と重みを返す。1件の記事では候補ごとに一度だけ数える。
+        """
+        weights = {}
+        if include_body:
+            body = (article.get("body") or "")[: TrendScorer.BODY_CHARS]
+            for term in TrendScorer.terms(body):
+                weights[KeywordExtractor.normalize(term)] = TrendScorer.BODY_WEIGHT
+        heading = f"{article.get('title') or ''}\n{article.get('keyword') or ''}"
+        for term in TrendScorer.terms(heading):
+            weights[KeywordExtractor.normalize(term)] = 1.0
+        return weights
+
+    @staticmethod
+    def _overlaps(a: str, b: str) -> bool:
+        return f" {a} " in f" {b} " or f" {b} " in f" {a} "
+
+    @staticmethod
+    def rank(
+        articles: List[Dict[str, str]],
+        baseline_articles: List[Dict[str, str]] = None,
+        exclude: KeywordMatcher = None,
+    ) -> List[TrendCandidate]:
+        """
+        直近の記事（title, body, keyword）から候補を抽出し、スコアの高い順に返す。
+        excludeに一致する記事と候補は除き、他の上位の候補と重複する候補（'DeepSeek' と 'DeepSeek R1' など）は上位のものだけを残す。
+        """
+        baseline_articles = baseline_articles or []
+        exclude = exclude or KeywordMatcher([])
+
+        weights = Counter()
+        counts = Counter()
+        surfaces: Dict[str, Counter] = {}
+        titles: Dict[str, List[str]] = {}
+        recent = 0
+        for article in articles:
+            title = article.get("title") or ""
+            if exclude.matches(title):
+                continue
+            recent += 1
+            for key, weight in TrendScorer._article_terms(article, True).items():
+                weights[key] += weight
+                counts[key] += 1
+                if len(titles.setdefault(key, [])) < TrendScorer.MAX_TITLES:
+                    titles[key].append(title)
+            text = "\n".join(
+                [
+                    title,
+                    article.get("keyword") or "",
+                    (article.get("body") or "")[: TrendScorer.BODY_CHARS],
+                ]
+            )
+            for term in TrendScorer.terms(text):
+                key = KeywordExtractor.normalize(term)
+                surfaces.setdefault(key, Counter())[term] += 1
+
+        # 除外キーワードの一部にあたる候補（'DeepSeek R1' に対する 'DeepSeek'）も除く
+        excluded_terms = set()
+        for keyword in exclude.keywords:
+            words = keyword.split()
+            for n in range(1, len(words) + 1):
+                for i in range(len(words) - n + 1):
+                    excluded_terms.add(" ".join(words[i : i + n]))
+
+        baseline_counts = Counter()
+        for article in baseline_articles:
+            baseline_counts.update(TrendScorer._article_terms(article, False).keys())
+        baseline = len(baseline_articles)
+
+        scored = []
+        for key, weight in weights.items():
+            if (
+                counts[key] < TrendScorer.MIN_ARTICLES
+                or key in excluded_terms
+                or exclude.matches(key)
+            ):
+                continue
+            # ベースラインに一度も出現しない語も比較できるよう、加算スムージングを行う
+            baseline_rate = (baseline_counts[key] + 1) / (baseline + 1)
+            burst = (weight / recent) / baseline_rate
+            score = weight * math.log2(1 + burst)
+            if " " in key:
+                score *= TrendScorer.MULTI_WORD_BONUS
+            surface = surfaces[key].most_common(1)[0][0]
+            scored.append(
+                (key, TrendCandidate(surface, score, counts[key], burst, titles[key]))
+            )
+        scored.sort(key=lambda item: (item[1].score, len(item[0])), reverse=True)
+
+        ranked = []
+        kept_keys = []
+        for key, candidate in scored:
+            if any(TrendScorer._overlaps(key, kept) for kept in kept_keys):
+                continue
+            kept_keys.append(key)
+            ranked.append(candidate)
+        return ranked
+
+    @staticmethod
+    def winner(candidates: List[TrendCandidate]) -> TrendCandidate:
+        """
+        1位の候補が明らかに優勢であれば返す。そうでなければNoneを返す。
+        """
+        if not candidates:
+            return None
+        top = candidates[0]
+        if top.count < TrendScorer.WINNER_MIN_ARTICLES:
+            return None
+        if len(candidates) > 1 and top.score < TrendScorer.WINNER_RATIO * candidates[1].score:
+            return None
+        return top
@@ -1,12 +1,33 @@
+import threading
+
+import httplib2
 from googleapiclient.discovery import build
 
 
 class WebSearcher:
 
+    # httplib2.Httpはスレッドセーフではないため、スレッドごとに1つ作って接続を再利用する
+    _local = threading.local()
+
+    @staticmethod
+    def _http() -> httplib2.Http:
+        http = getattr(WebSearcher._local, "http", None)
+        if http is None:
+            http = httplib2.Http()
+            WebSearcher._local.http = http
+        return http
+
     def __init__(self, google_custom_search_api_key: str, google_search_cse_id: str):
         self.api_key = google_custom_search_api_key
         self.cse_id = google_search_cse_id
-        self.service = build("customsearch", "v1", developerKey=self.api_key)
+        # ライブラリに同梱のディスカバリドキュメントを使い、生成時に通信しない
+        self.service = build(
+            "customsearch",
+            "v1",
+            developerKey=self.api_key,
+            static_discovery=True,
+            cache_discovery=False,
+        )
 
     def search(self, query: str, num_results: int = 10):
         result = (
@@ -17,7 +38,8 @@ class WebSearcher:
                 dateRestrict="w2",  # 過去2週間
                 num=num_results,
             )
-            .execute()
+            # serviceは複数のスレッドで共有するため、スレッドごとのhttplib2.Httpを使う
+            .execute(http=WebSearcher._http())
         )
 
         items = result.get("items", [])